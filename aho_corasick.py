@@ -0,0 +1,71 @@
+from collections import deque
+from functools import lru_cache
+
+# automatons kept for the term sets searched most recently
+AUTOMATON_CACHE_SIZE = 32
+
+"""
+Aho-Corasick automaton over a set of terms, for finding all of them in one
+pass over a text.
+
+The trie of the terms is completed into a DFA: every state maps each
+character it can continue with to the next state, following failure links
+ahead of time, so scanning costs a dict lookup or two per character.
+Transitions a state would inherit from the root are left out of its dict and
+looked up in root instead, which keeps automatons of large glossaries small.
+outputs holds, per state, the indexes of the terms ending there.
+"""
+class Automaton(object):
+
+  def __init__(self, terms):
+    self.terms = tuple(terms)
+    self.lengths = [len(term) for term in self.terms]
+    goto = [{}]
+    outputs = [[]]
+    for term_idx, term in enumerate(self.terms):
+      state = 0
+      for char in term:
+        next_state = goto[state].get(char)
+        if next_state is None:
+          next_state = goto[state][char] = len(goto)
+          goto.append({})
+          outputs.append([])
+        state = next_state
+      outputs[state].append(term_idx)
+    root = goto[0]
+    fail = [0] * len(goto)
+    delta = [{} for _ in goto]
+    queue = deque(root.values())
+    while queue:
+      state = queue.popleft()
+      outputs[state].extend(outputs[fail[state]])
+      delta[state].update(delta[fail[state]])
+      delta[state].update(goto[state])
+      for char, next_state in goto[state].items():
+        fail[next_state] = (delta[fail[state]].get(char) or root.get(char, 0)) if state else 0
+        queue.append(next_state)
+    self.root = root
+    self.delta = delta
+    self.outputs = [tuple(terms) for terms in outputs]
+
+  def iter_matches(self, text, start=0, stop=None):
+    """
+    Yields (start offset, term index) for every occurrence of every term in
+    text[start:stop], overlapping ones included, ordered by where they end
+    """
+    root, delta, outputs, lengths = self.root, self.delta, self.outputs, self.lengths
+    state = 0
+    end = start
+    for char in text[start:stop]:
+      end += 1
+      state = delta[state].get(char) or root.get(char, 0)
+      if outputs[state]:
+        for term_idx in outputs[state]:
+          yield end - lengths[term_idx], term_idx
+
+"""
+The Automaton for a tuple of terms, built once per term set
+"""
+@lru_cache(maxsize=AUTOMATON_CACHE_SIZE)
+def automaton(terms):
+  return Automaton(terms)
@@ -0,0 +1,283 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "scripts"))
+
+import course_index
+import subtitle_parser
+from phrase_occurrences import find_occurrences, page_occurrences, ranked_occurrences
+
+EXAMPLES = os.path.join(ROOT, "examples")
+RESULT_LIMIT = 100
+# fresh interpreters timed by bench_startup
+STARTUP_RUNS = 3
+STARTUP_SCRIPT = """
+import json, resource, sys, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+main.warm_up()
+warmed = time.perf_counter()
+print(json.dumps({"import_seconds": imported - start, "warm_up_seconds": warmed - imported,
+  "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+  "voice_imported": "houndify" in sys.modules}))
+"""
+# a metric counts as regressed when it grows by more than this fraction
+THRESHOLD = 0.2
+
+csrf_matcher = re.compile('name="csrf_token" type="hidden" value="([^"]+)"')
+
+"""
+Benchmarks over the courses bundled in examples/.
+
+Measures subtitle parsing throughput, index build time and memory, query
+latency for rare, common and multi-word terms, and route latency through the
+Flask test client, for every course and for synthetic courses with 10x/100x
+the lectures. Worker startup, importing main and warming up every course
+index, is timed in fresh interpreters. Results are written as json; --compare flags metrics that got
+slower than a previous run.
+
+  python benchmarks/bench.py --output before.json
+  python benchmarks/bench.py --output after.json --compare before.json
+"""
+
+def timed(function, repeat):
+  """
+  Median and worst run time of function in milliseconds, and its last result
+  """
+  times = []
+  for _ in range(repeat):
+    start = time.perf_counter()
+    result = function()
+    times.append((time.perf_counter() - start) * 1000)
+  times.sort()
+  return {"median_ms": times[len(times) // 2], "max_ms": times[-1]}, result
+
+def courses():
+  return sorted(name for name in os.listdir(EXAMPLES) if os.path.exists(os.path.join(EXAMPLES, name, name + ".json")))
+
+def json_path(name, examples=EXAMPLES):
+  return os.path.join(examples, name, name + ".json")
+
+def bench_parse(name):
+  directory = os.path.join(EXAMPLES, name, "raw_subtitles")
+  files = subtitle_parser.subtitle_files(directory)
+  size = sum(os.path.getsize(os.path.join(directory, filename)) for filename in files)
+  start = time.perf_counter()
+  subtitle_parser.parse(directory)
+  seconds = time.perf_counter() - start
+  return {"files": len(files), "seconds": seconds, "files_per_s": len(files) / seconds, "mb_per_s": size / seconds / 1e6}
+
+def bench_build(path):
+  """
+  Load and index build times and memory for a course. The course is built
+  from the file and mtime courses.get would load, so bench_queries can hand
+  it to the cache without it being reloaded inside the timings.
+  """
+  gc.collect()
+  timings = {}
+  start = time.perf_counter()
+  course = course_index.CourseIndex(*course_index._resolve(path))
+  timings["load_seconds"] = time.perf_counter() - start
+  start = time.perf_counter()
+  course.trigram_index()
+  timings["trigram_seconds"] = time.perf_counter() - start
+  del course
+  gc.collect()
+  tracemalloc.start()
+  course = course_index.CourseIndex(*course_index._resolve(path))
+  timings["load_mb"] = tracemalloc.get_traced_memory()[0] / 1e6
+  course.trigram_index()
+  timings["indexed_mb"] = tracemalloc.get_traced_memory()[0] / 1e6
+  tracemalloc.stop()
+  return timings, course
+
+def query_terms(course):
+  """
+  A rare word, the most common word and the most common two-word phrase of a course
+  """
+  vocabulary = course.vocabulary()
+  terms = [(vocabulary.counts[term_idx], vocabulary.term(term_idx)) for term_idx in range(len(vocabulary))]
+  by_count = sorted((count, term) for count, term in terms if " " not in term)
+  rare = next((term for count, term in by_count if len(term) >= 6), by_count[0][1])
+  common = by_count[-1][1]
+  phrase = max(((count, term) for count, term in terms if " " in term), default=(0, common))[1]
+  return {"rare": rare, "common": common, "phrase": phrase}
+
+def bench_queries(path, course, repeat):
+  course_index.courses.put(path, course)
+  results = {}
+  for kind, term in query_terms(course).items():
+    results[kind] = {"term": term}
+    results[kind]["find_occurrences"], found = timed(lambda: find_occurrences(term, path), repeat)
+    results[kind]["hits"] = len(found[0])
+    results[kind]["first_page"], _ = timed(lambda: page_occurrences(term, path, RESULT_LIMIT), repeat)
+    results[kind]["ranked"], _ = timed(lambda: ranked_occurrences(term, path, RESULT_LIMIT), repeat)
+  return results
+
+def bench_routes(name, terms, repeat):
+  os.chdir(ROOT)
+  try:
+    import main
+  except Exception as error:
+    return {"skipped": "%s: %s" % (type(error).__name__, error)}
+  client = main.app.test_client()
+  results = {}
+  results["home"], _ = timed(lambda: client.get("/"), repeat)
+  results["course"], _ = timed(lambda: client.get("/" + name), repeat)
+  for kind, term in terms.items():
+    url = "/%s/%s" % (name, term)
+    def uncached():
+      main.result_cache.invalidate()
+      return client.get(url)
+    results[kind + "_uncached"], _ = timed(uncached, repeat)
+    results[kind + "_cached"], _ = timed(lambda: client.get(url), repeat)
+  # the phrase's two words are said next to each other, so this has results
+  near = " NEAR/30 ".join(terms["phrase"].split()[:2])
+  results["near_form"], response = timed(lambda: search_form(client, name, near), repeat)
+  assert response.status_code == 200 and b"excerpt-box" in response.data, "no results page for %r" % near
+  return results
+
+def search_form(client, name, query):
+  """
+  Submits query from the search box of a course page and follows the redirect
+  to its results
+  """
+  token = csrf_matcher.search(client.get("/" + name).get_data(as_text=True))
+  data = {"query": query, "csrf_token": token.group(1) if token else ""}
+  return client.post("/" + name, data=data, follow_redirects=True)
+
+"""
+Times importing main and main.warm_up() in fresh interpreters, as the gunicorn
+worker does before taking requests, keeping the fastest of runs. The voice stack
+should not be imported by either.
+"""
+def bench_startup(runs):
+  best = None
+  for _ in range(runs):
+    output = subprocess.check_output([sys.executable, "-c", STARTUP_SCRIPT], cwd=ROOT)
+    result = json.loads(output.decode().strip().splitlines()[-1])
+    if best is None or result["import_seconds"] + result["warm_up_seconds"] < best["import_seconds"] + best["warm_up_seconds"]:
+      best = result
+  return best
+
+"""
+Writes a copy of a course with every lecture repeated factor times (with
+distinct video ids) into directory and returns its json path.
+"""
+def scaled_course(name, factor, directory):
+  with open(json_path(name)) as file:
+    data = json.load(file)
+  scaled = {}
+  for copy in range(factor):
+    for video_title, video_data in data.items():
+      scaled["%s_%d" % (video_title, copy)] = video_data
+  scaled_name = "%s_x%d" % (name, factor)
+  os.makedirs(os.path.join(directory, scaled_name))
+  path = json_path(scaled_name, directory)
+  with open(path, "w") as file:
+    json.dump(scaled, file)
+  return path
+
+def run(args):
+  names = args.courses or courses()
+  report = {"meta": meta(), "results": {}}
+  results = report["results"]
+  if not args.skip_startup:
+    print("startup", file=sys.stderr)
+    results["startup"] = bench_startup(args.startup_runs)
+  for name in names:
+    path = json_path(name)
+    print("course", name, file=sys.stderr)
+    if not args.skip_parse and os.path.isdir(os.path.join(EXAMPLES, name, "raw_subtitles")):
+      results["parse/" + name] = bench_parse(name)
+    build, course = bench_build(path)
+    results["build/" + name] = build
+    results["query/" + name] = bench_queries(path, course, args.repeat)
+    if not args.skip_routes:
+      results["route/" + name] = bench_routes(name, query_terms(course), args.repeat)
+  scale_dir = tempfile.mkdtemp()
+  try:
+    for factor in args.scales:
+      print("scale", args.scale_course, factor, file=sys.stderr)
+      path = scaled_course(args.scale_course, factor, scale_dir)
+      build, course = bench_build(path)
+      results["build/%s_x%d" % (args.scale_course, factor)] = build
+      results["query/%s_x%d" % (args.scale_course, factor)] = bench_queries(path, course, args.repeat)
+      del course
+      course_index.courses.discard(path)
+  finally:
+    shutil.rmtree(scale_dir)
+  return report
+
+def meta():
+  try:
+    commit = subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=ROOT, stderr=subprocess.DEVNULL).decode().strip()
+  except (OSError, subprocess.CalledProcessError):
+    commit = None
+  return {"time": time.strftime("%Y-%m-%dT%H:%M:%S"), "commit": commit, "python": platform.python_version(), "platform": platform.platform()}
+
+"""
+Flattens nested results into "section/course/.../metric" -> value.
+"""
+def flatten(results, prefix=""):
+  flat = {}
+  for key, value in results.items():
+    if isinstance(value, dict):
+      flat.update(flatten(value, prefix + key + "/"))
+    elif isinstance(value, (int, float)):
+      flat[prefix + key] = value
+  return flat
+
+"""
+Returns (metric, old, new) for every time or memory metric that grew by more
+than threshold since the baseline.
+"""
+def regressions(baseline, report, threshold):
+  old, new = flatten(baseline["results"]), flatten(report["results"])
+  slower = []
+  for metric in sorted(set(old) & set(new)):
+    if not metric.endswith(("_ms", "seconds", "_mb")) or metric.endswith("max_ms"):
+      continue
+    if old[metric] > 0 and new[metric] > old[metric] * (1 + threshold):
+      slower.append((metric, old[metric], new[metric]))
+  return slower
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description="Benchmarks parsing, indexing and search over examples/.")
+  parser.add_argument("--courses", nargs="*", help="courses to run (default: all in examples/)")
+  parser.add_argument("--repeat", type=int, default=20, help="runs per timed query")
+  parser.add_argument("--scales", type=int, nargs="*", default=[10, 100], help="lecture multipliers for the synthetic course")
+  parser.add_argument("--scale-course", default="hazel_sive", help="course the synthetic courses are made from")
+  parser.add_argument("--skip-parse", action="store_true", help="do not benchmark subtitle parsing")
+  parser.add_argument("--skip-routes", action="store_true", help="do not benchmark Flask routes")
+  parser.add_argument("--skip-startup", action="store_true", help="do not time worker startup")
+  parser.add_argument("--startup-runs", type=int, default=STARTUP_RUNS, help="fresh interpreters timed for startup")
+  parser.add_argument("--output", help="write results json here (default: stdout)")
+  parser.add_argument("--compare", metavar="BASELINE", help="results json of an earlier run to compare against")
+  parser.add_argument("--threshold", type=float, default=THRESHOLD, help="allowed slowdown before a metric is flagged")
+  args = parser.parse_args()
+  report = run(args)
+  if args.output:
+    with open(args.output, "w") as file:
+      json.dump(report, file, indent = 2, sort_keys=True)
+  else:
+    print(json.dumps(report, indent = 2, sort_keys=True))
+  if args.compare:
+    with open(args.compare) as file:
+      slower = regressions(json.load(file), report, args.threshold)
+    for metric, old, new in slower:
+      print("REGRESSION %s: %.3f -> %.3f" % (metric, old, new), file=sys.stderr)
+    sys.exit(1 if slower else 0)
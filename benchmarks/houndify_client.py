@@ -0,0 +1,229 @@
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import socket
+import sys
+import threading
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import houndify
+
+# bytes handed to fill() per call; not a multiple of the frame size, so frames straddle calls
+PIECE_SIZE = 3000
+SAMPLE_RATE = 16000
+# wav header sent by StreamingHoundClient.start before the audio
+WAV_HEADER_SIZE = 44
+
+"""
+Drives the Houndify clients against a local stand-in for the Houndify
+servers, which speaks plain HTTP on 127.0.0.1.
+
+stream pumps minutes of synthetic PCM through StreamingHoundClient (or, with
+--clients N, through N concurrent AsyncStreamingHoundClients); the server
+decodes the chunked request body, checks every audio byte arrived and answers
+with partial transcripts and a final result as chunked json lines. text sends
+--queries text queries through TextHoundClient and AsyncTextHoundClient and
+reports how many connections they opened.
+
+  python benchmarks/houndify_client.py stream --minutes 10
+  python benchmarks/houndify_client.py stream --minutes 1 --clients 50
+  python benchmarks/houndify_client.py text --queries 1000
+"""
+
+class StandInServer(object):
+
+  def __init__(self, partials=10, response_kb=64):
+    self.partials = partials
+    self.response_kb = response_kb
+    self.connections = 0
+    self.received = []
+    self._lock = threading.Lock()
+    self.listener = socket.socket()
+    self.listener.bind(("127.0.0.1", 0))
+    self.listener.listen(128)
+    self.port = self.listener.getsockname()[1]
+    threading.Thread(target=self._accept, daemon=True).start()
+
+  def _accept(self):
+    while True:
+      conn, _ = self.listener.accept()
+      with self._lock:
+        self.connections += 1
+      threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+  def _serve(self, conn):
+    with conn:
+      reader = conn.makefile("rb")
+      while True:
+        request_line = reader.readline()
+        if not request_line:
+          return
+        headers = {}
+        while True:
+          line = reader.readline()
+          if line in (b"\r\n", b""):
+            break
+          header, _, value = line.decode("latin-1").partition(":")
+          headers[header.strip().lower()] = value.strip()
+        if request_line.startswith(b"GET"):
+          self._text(conn, headers)
+        else:
+          self._voice(conn, reader)
+          return
+
+  def _text(self, conn, headers):
+    body = json.dumps({"Format": "HoundQueryResult", "Status": "OK", "AllResults": []}).encode("utf-8")
+    if headers.get("hound-response-accept-encoding") == "gzip":
+      body = gzip.compress(body)
+    conn.sendall(b"HTTP/1.1 200 OK\r\nContent-Length: %d\r\n\r\n" % len(body) + body)
+
+  def _voice(self, conn, reader):
+    received = 0
+    while True:
+      size = int(reader.readline(), 16)
+      if size == 0:
+        reader.readline()
+        break
+      received += len(reader.read(size))
+      reader.readline()
+    with self._lock:
+      self.received.append(received)
+    conn.sendall(b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n")
+    for i in range(self.partials):
+      self._chunk(conn, {"Format": "HoundVoiceQueryPartialTranscript", "PartialTranscript": "partial %d" % i})
+    self._chunk(conn, {"Format": "HoundQueryResult", "Status": "OK", "Padding": "x" * (self.response_kb * 1024)})
+    conn.sendall(b"0\r\n\r\n")
+
+  def _chunk(self, conn, message):
+    body = json.dumps(message).encode("utf-8")
+    conn.sendall(b"%x\r\n" % len(body) + body + b"\r\n")
+
+
+class Listener(houndify.HoundListener):
+
+  def __init__(self):
+    self.partials = 0
+    self.final = None
+
+  def onPartialTranscript(self, transcript):
+    self.partials += 1
+
+  def onFinalResponse(self, response):
+    self.final = response
+
+
+def local(client_class, server, **kwargs):
+  client = client_class("id", "a2V5", "user", hostname="127.0.0.1", port=server.port, https=False, **kwargs)
+  client.gzip = False
+  return client
+
+def stream(minutes, piece_size, trace):
+  audio = os.urandom(int(minutes * 60 * SAMPLE_RATE * 2))
+  server = StandInServer()
+  client = local(houndify.StreamingHoundClient, server, sampleRate=SAMPLE_RATE, enableVAD=False)
+  listener = Listener()
+  if trace:
+    tracemalloc.start()
+  start = time.perf_counter()
+  client.start(listener)
+  view = memoryview(audio)
+  for offset in range(0, len(audio), piece_size):
+    client.fill(view[offset:offset + piece_size])
+  fill_seconds = time.perf_counter() - start
+  client.finish()
+  total_seconds = time.perf_counter() - start
+  peak = tracemalloc.get_traced_memory()[1] if trace else None
+  if trace:
+    tracemalloc.stop()
+  assert server.received == [len(audio) + WAV_HEADER_SIZE], (server.received, len(audio))
+  assert listener.final is not None and listener.partials == server.partials
+  return {
+    "audio_mb": len(audio) / 1e6,
+    "fill_seconds": fill_seconds,
+    "total_seconds": total_seconds,
+    "mb_per_s": len(audio) / fill_seconds / 1e6,
+    "realtime_factor": minutes * 60 / total_seconds,
+    "peak_traced_mb": peak / 1e6 if peak is not None else None
+  }
+
+def stream_async(minutes, piece_size, clients):
+  audio = os.urandom(int(minutes * 60 * SAMPLE_RATE * 2))
+  server = StandInServer()
+
+  async def utterance():
+    client = local(houndify.AsyncStreamingHoundClient, server, sampleRate=SAMPLE_RATE, enableVAD=False)
+    listener = Listener()
+    await client.start(listener)
+    view = memoryview(audio)
+    for offset in range(0, len(audio), piece_size):
+      await client.fill(view[offset:offset + piece_size])
+    await client.finish()
+    return listener
+
+  async def run_all():
+    return await asyncio.gather(*[utterance() for _ in range(clients)])
+
+  start = time.perf_counter()
+  listeners = asyncio.run(run_all())
+  seconds = time.perf_counter() - start
+  assert server.received == [len(audio) + WAV_HEADER_SIZE] * clients, server.received
+  assert all(listener.final is not None and listener.partials == server.partials for listener in listeners)
+  return {
+    "clients": clients,
+    "audio_mb": clients * len(audio) / 1e6,
+    "total_seconds": seconds,
+    "mb_per_s": clients * len(audio) / seconds / 1e6,
+    "realtime_factor": clients * minutes * 60 / seconds
+  }
+
+def text(queries):
+  results = {}
+  for pool_size in (0, houndify.POOL_SIZE):
+    server = StandInServer()
+    client = local(houndify.TextHoundClient, server, poolSize=pool_size)
+    client.gzip = True
+    start = time.perf_counter()
+    for i in range(queries):
+      assert client.query("query %d" % i)["Status"] == "OK"
+    seconds = time.perf_counter() - start
+    client.close()
+    results["pool_%d" % pool_size] = {"ms_per_query": seconds / queries * 1000, "connections": server.connections}
+
+  server = StandInServer()
+  async def run_async():
+    client = local(houndify.AsyncTextHoundClient, server)
+    client.gzip = True
+    async def one(i):
+      return await client.query("query %d" % i)
+    start = time.perf_counter()
+    for batch in range(0, queries, houndify.POOL_SIZE):
+      responses = await asyncio.gather(*[one(i) for i in range(batch, min(batch + houndify.POOL_SIZE, queries))])
+      assert all(response["Status"] == "OK" for response in responses)
+    seconds = time.perf_counter() - start
+    await client.close()
+    return seconds
+  seconds = asyncio.run(run_async())
+  results["async"] = {"ms_per_query": seconds / queries * 1000, "connections": server.connections}
+  return results
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description="Drives the Houndify clients against a local stand-in server.")
+  parser.add_argument("mode", choices=["stream", "text"], help="stream audio or send text queries")
+  parser.add_argument("--minutes", type=float, default=5, help="minutes of 16 kHz audio per stream")
+  parser.add_argument("--piece-size", type=int, default=PIECE_SIZE, help="bytes passed to each fill() call")
+  parser.add_argument("--clients", type=int, help="concurrent AsyncStreamingHoundClients instead of one StreamingHoundClient")
+  parser.add_argument("--trace", action="store_true", help="also report peak traced memory (slower)")
+  parser.add_argument("--queries", type=int, default=200, help="text queries per client")
+  args = parser.parse_args()
+  if args.mode == "text":
+    report = text(args.queries)
+  elif args.clients:
+    report = stream_async(args.minutes, args.piece_size, args.clients)
+  else:
+    report = stream(args.minutes, args.piece_size, args.trace)
+  print(json.dumps(report, indent = 2))
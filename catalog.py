@@ -0,0 +1,93 @@
+import os
+import threading
+import time
+from collections import namedtuple
+
+# slug is the course directory name, e.g. andrew_ng; index_path is its json
+Course = namedtuple("Course", ["slug", "display_name", "course_title", "index_path", "stats"])
+
+# seconds between checks of the courses directory for changes
+CHECK_INTERVAL = 2
+
+"""
+The courses available under a directory such as examples/, where every course
+lives in <slug>/ with a <slug>.txt course title and a <slug>.json index.
+
+The directory is scanned once and served from memory afterwards. At most
+every check_interval seconds the mtimes of the directory, each course
+directory and its files are compared with the last scan, and the catalog is
+rebuilt when any of them changed.
+"""
+class Catalog(object):
+
+  def __init__(self, root, check_interval=CHECK_INTERVAL):
+    self.root = root
+    self.check_interval = check_interval
+    self._lock = threading.Lock()
+    self._courses = {}
+    self._signature = None
+    self._checked = 0
+    self.refresh()
+
+  def courses(self):
+    """
+    All courses, ordered by slug
+    """
+    return list(self._current().values())
+
+  def get(self, slug):
+    """
+    The Course for a slug, or None if there is no such course
+    """
+    return self._current().get(slug)
+
+  def refresh(self):
+    with self._lock:
+      self._courses = self._scan()
+      self._signature = self._signature_of(self._courses)
+      self._checked = time.monotonic()
+
+  def _current(self):
+    if time.monotonic() - self._checked >= self.check_interval:
+      with self._lock:
+        if time.monotonic() - self._checked >= self.check_interval:
+          signature = self._signature_of(self._courses)
+          if signature != self._signature:
+            self._courses = self._scan()
+            signature = self._signature_of(self._courses)
+          self._signature = signature
+          self._checked = time.monotonic()
+    return self._courses
+
+  def _signature_of(self, courses):
+    mtimes = [_mtime(self.root)]
+    for course in courses.values():
+      base = os.path.splitext(course.index_path)[0]
+      mtimes.append(_mtime(os.path.dirname(base)))
+      mtimes.append(_mtime(base + ".txt"))
+      mtimes.append(_mtime(course.index_path))
+    return mtimes
+
+  def _scan(self):
+    courses = {}
+    for entry in os.scandir(self.root):
+      if not entry.is_dir():
+        continue
+      slug = entry.name
+      base = os.path.join(self.root, slug, slug)
+      try:
+        with open(base + ".txt", "r") as file:
+          course_title = file.read()
+        stat = os.stat(base + ".json")
+      except OSError:
+        continue
+      stats = {"bytes": stat.st_size, "modified": stat.st_mtime}
+      courses[slug] = Course(slug, slug.replace("_", " ").title(), course_title, base + ".json", stats)
+    return dict(sorted(courses.items()))
+
+
+def _mtime(path):
+  try:
+    return os.stat(path).st_mtime_ns
+  except OSError:
+    return None
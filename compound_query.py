@@ -0,0 +1,145 @@
+import re
+from collections import namedtuple
+from fnmatch import fnmatchcase
+
+# seconds allowed between terms joined by a bare NEAR
+NEAR_SECONDS = 30
+
+token_matcher = re.compile(r'"([^"]*)"|(\S+)')
+near_matcher = re.compile(r"NEAR(?:/(\d+))?$")
+time_matcher = re.compile(r"(?:(?:(\d+):)?(\d+):)?(\d+)$")
+lecture_matcher = re.compile(r"(?:lecture|video)\s*(\d+(?:\.\d+)*)", re.IGNORECASE)
+number_matcher = re.compile(r"[\d.*?]+$")
+
+"""
+A search with operators: terms are the phrases searched for, the first being
+the one reported; within gives, for each later term, the seconds within
+which it must be said of the first. lectures holds the patterns of the
+lectures searched (all when empty), and start and end bound the second a
+match is said at (None for no bound).
+"""
+Query = namedtuple("Query", ["terms", "within", "lectures", "start", "end"])
+
+"""
+Parses a search with operators:
+  bias NEAR/30 variance   variance said within 30 seconds of bias (NEAR alone
+                          is NEAR/30); each NEAR term is measured from the first
+  lecture:10              lectures numbered 10 or 10.x; also globs such as
+                          lecture:1?.*, a YouTube id or words of the title
+  from:2:30 to:5:00       matches said from 2:30 up to 5:00 into the lecture
+Quoted phrases are searched as they are, operators included. Returns None for
+searches without operators, or whose operators are incomplete, which are
+searched as plain phrases.
+"""
+def parse_query(text):
+  terms = []
+  within = []
+  lectures = []
+  start = end = None
+  words = []
+  compound = False
+  for quoted, word in token_matcher.findall(text):
+    near = near_matcher.match(word)
+    field, _, value = word.partition(":")
+    if near is not None:
+      if not "".join(words):
+        return None
+      terms.append(" ".join(words))
+      within.append(int(near.group(1) or NEAR_SECONDS))
+      words = []
+    elif field in ("lecture", "from", "to") and value:
+      if field == "lecture":
+        lectures.append(value)
+      else:
+        seconds = parse_time(value)
+        if seconds is None:
+          return None
+        if field == "from":
+          start = seconds
+        else:
+          end = seconds
+    else:
+      words.append(quoted or word)
+      continue
+    compound = True
+  if not compound or not "".join(words):
+    return None
+  terms.append(" ".join(words))
+  return Query(terms, within, lectures, start, end)
+
+"""
+Seconds of a time given as seconds, m:ss or h:mm:ss, or None
+"""
+def parse_time(text):
+  match = time_matcher.match(text)
+  if match is None:
+    return None
+  hours, minutes, seconds = (int(group or 0) for group in match.groups())
+  return (hours * 60 + minutes) * 60 + seconds
+
+"""
+Whether a lecture is selected by a lecture: pattern. Numeric patterns are
+compared with the lecture number in the title, ignoring leading zeros;
+anything else must be the YouTube id or part of the title.
+"""
+def lecture_matches(pattern, title, youtube_id):
+  if pattern == youtube_id:
+    return True
+  number = lecture_matcher.search(title)
+  if number is not None and number_matcher.match(pattern):
+    number = _normalize(number.group(1))
+    pattern = _normalize(pattern)
+    return number == pattern or number.startswith(pattern + ".") or fnmatchcase(number, pattern)
+  return pattern.lower() in title.lower()
+
+def _normalize(number):
+  return ".".join(part.lstrip("0") or part[-1:] for part in number.split("."))
+
+"""
+A bytearray with one byte per video of the course, set for the videos the
+lecture patterns select, or None when every video is searched
+"""
+def video_filter(course, lectures):
+  if not lectures:
+    return None
+  return bytearray(any(lecture_matches(pattern, video.title, video.youtube_id) for pattern in lectures)
+    for video in course.videos)
+
+"""
+Returns the matches of query in course as (video index, line index, start
+character, length) of its first term, in course order.
+
+Each term is found once, only in the videos the filter selects, and its
+matches become postings keyed by (video index, second) in course order. The
+time window drops postings outside it, and every NEAR term is merge-joined
+with the first term's postings in one linear pass, keeping those with a
+posting of the term within its seconds.
+"""
+def run_query(query, course, fuzzy=False):
+  trigram_index = course.trigram_index()
+  videos = video_filter(course, query.lectures)
+  postings = [_postings(course, trigram_index.find(term.lower(), fuzzy, videos), query.start, query.end)
+    for term in query.terms]
+  anchor = postings[0]
+  for seconds, other in zip(query.within, postings[1:]):
+    anchor = _near(anchor, other, seconds)
+  return [hit for key, hit in anchor]
+
+def _postings(course, hits, start, end):
+  postings = []
+  for hit in hits:
+    second = course.videos[hit[0]].timestamps[hit[1]]
+    if (start is None or second >= start) and (end is None or second < end):
+      postings.append(((hit[0], second), hit))
+  return postings
+
+def _near(anchor, other, seconds):
+  kept = []
+  lo = 0
+  for key, hit in anchor:
+    video_idx, second = key
+    while lo < len(other) and other[lo][0] < (video_idx, second - seconds):
+      lo += 1
+    if lo < len(other) and other[lo][0] <= (video_idx, second + seconds):
+      kept.append((key, hit))
+  return kept
@@ -0,0 +1,180 @@
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+from array import array
+
+title_matcher = re.compile("Title=(.*)_Id=(.*)") # YouTube code only
+
+COURSE_SUFFIX = ".course"
+MAGIC = b"CSTAMP01"
+# magic, videos, lines, names bytes, text bytes, lowered text bytes
+HEADER = struct.Struct("<8sIIIII")
+
+"""
+Compact binary course files.
+
+A course file holds everything in a course json file as flat arrays so it can
+be memory-mapped read-only: its pages are read through the page cache as
+searches touch them instead of being kept as Python strings.
+
+Layout, all integers little-endian int32, right after the header:
+  video_starts[videos + 1]      first line id of each video
+  name_offsets[2 * videos + 1]  title and YouTube id of each video in the names blob
+  timestamps[lines]             start of each line in seconds
+  line_offsets[lines + 1]       each line in the text blob
+  lowered_offsets[lines + 1]    each lowercased line in the lowered blob
+followed by the names, text and lowered blobs (UTF-8).
+"""
+
+"""
+Writes a course file from subtitle_parser.py output (or a loaded course json):
+a dict of "Title=..._Id=..." -> {seconds: line}. Videos keep the given order,
+lines are sorted by their numeric timestamp.
+The file is replaced atomically, so processes mapping an older version keep
+reading it safely.
+"""
+def write_course(subtitles, filename):
+  video_starts = array("i", [0])
+  name_offsets = array("i", [0])
+  timestamps = array("i")
+  line_offsets = array("i", [0])
+  lowered_offsets = array("i", [0])
+  names = bytearray()
+  text = bytearray()
+  lowered = bytearray()
+  for video_title in subtitles:
+    title_obj = title_matcher.match(video_title)
+    for name in title_obj.group(1, 2):
+      names += name.encode("utf-8")
+      name_offsets.append(len(names))
+    video_data = subtitles[video_title]
+    for timestamp in sorted(video_data, key=int):
+      line = video_data[timestamp]
+      timestamps.append(int(timestamp))
+      text += line.encode("utf-8")
+      line_offsets.append(len(text))
+      lowered += line.lower().encode("utf-8")
+      lowered_offsets.append(len(lowered))
+    video_starts.append(len(timestamps))
+
+  tables = (video_starts, name_offsets, timestamps, line_offsets, lowered_offsets)
+  if sys.byteorder != "little":
+    for table in tables:
+      table.byteswap()
+  tmp_filename = filename + ".tmp"
+  with open(tmp_filename, "wb") as file:
+    file.write(HEADER.pack(MAGIC, len(video_starts) - 1, len(timestamps), len(names), len(text), len(lowered)))
+    for table in tables:
+      table.tofile(file)
+    file.write(names)
+    file.write(text)
+    file.write(lowered)
+  os.replace(tmp_filename, filename)
+
+
+"""
+A read-only sequence over part of a course file, decoding items on access.
+"""
+class View(object):
+  __slots__ = ("get", "start", "stop")
+
+  def __init__(self, get, start, stop):
+    self.get = get
+    self.start = start
+    self.stop = stop
+
+  def __len__(self):
+    return self.stop - self.start
+
+  def __getitem__(self, index):
+    if index < 0:
+      index += self.stop - self.start
+    if not 0 <= index < self.stop - self.start:
+      raise IndexError("view index out of range")
+    return self.get(self.start + index)
+
+  def __iter__(self):
+    get = self.get
+    for line_id in range(self.start, self.stop):
+      yield get(line_id)
+
+
+"""
+A memory-mapped course file. Tables are memoryviews straight into the map
+and text is only decoded for the lines that are actually read.
+"""
+class CourseFile(object):
+
+  def __init__(self, filename):
+    with open(filename, "rb") as file:
+      self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    self.view = memoryview(self.map)
+    magic, videos, lines, names_size, text_size, lowered_size = HEADER.unpack_from(self.map)
+    if magic != MAGIC:
+      raise ValueError("Not a course file: " + filename)
+    self.num_videos = videos
+    self.num_lines = lines
+    self._offset = HEADER.size
+    self.video_starts = self._ints(videos + 1)
+    self.name_offsets = self._ints(2 * videos + 1)
+    self.timestamps = self._ints(lines)
+    self.line_offsets = self._ints(lines + 1)
+    self.lowered_offsets = self._ints(lines + 1)
+    self.names = self._bytes(names_size)
+    self.text = self._bytes(text_size)
+    self.lowered_text = self._bytes(lowered_size)
+
+  def _ints(self, count):
+    table = self.view[self._offset:self._offset + 4 * count].cast("i")
+    self._offset += 4 * count
+    if sys.byteorder != "little":
+      table = array("i", table)
+      table.byteswap()
+    return table
+
+  def _bytes(self, size):
+    blob = self.view[self._offset:self._offset + size]
+    self._offset += size
+    return blob
+
+  def video(self, video_idx):
+    """
+    Returns (title, youtube_id) of a video
+    """
+    offsets = self.name_offsets
+    i = 2 * video_idx
+    return (str(self.names[offsets[i]:offsets[i + 1]], "utf-8"),
+            str(self.names[offsets[i + 1]:offsets[i + 2]], "utf-8"))
+
+  def line(self, line_id):
+    return str(self.text[self.line_offsets[line_id]:self.line_offsets[line_id + 1]], "utf-8")
+
+  def lowered(self, line_id):
+    return str(self.lowered_text[self.lowered_offsets[line_id]:self.lowered_offsets[line_id + 1]], "utf-8")
+
+  def line_bytes(self, line_id):
+    """
+    The raw UTF-8 of a line as a zero-copy memoryview
+    """
+    return self.text[self.line_offsets[line_id]:self.line_offsets[line_id + 1]]
+
+
+"""
+Converts existing course json files into course files next to them, e.g.
+  python course_file.py examples/*/*.json
+"""
+def convert(json_filename):
+  with open(json_filename) as file:
+    subtitles = json.load(file)
+  filename = os.path.splitext(json_filename)[0] + COURSE_SUFFIX
+  write_course(subtitles, filename)
+  return filename
+
+if __name__ == '__main__':
+  args = sys.argv
+  assert len(args) > 1, "Must provide course json files"
+  for json_filename in args[1:]:
+    print(convert(json_filename))
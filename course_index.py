@@ -0,0 +1,268 @@
+import json
+import os
+import sys
+import threading
+from array import array
+from collections import OrderedDict
+from course_file import COURSE_SUFFIX, CourseFile, View, title_matcher
+from trigram_index import TrigramIndex
+from vocabulary import course_vocabulary, video_texts
+from word_timings import WordFile, words_path
+
+"""
+A single lecture of a course: its title, YouTube id and subtitle lines as
+parallel columns. timestamps is an int array of the second each line starts
+at, sorted numerically, so lines[i] is spoken from timestamps[i]. words is
+the video's WordStream when the course has a word file, otherwise None.
+"""
+class Video(object):
+  __slots__ = ("title", "youtube_id", "timestamps", "lines", "lowered", "words")
+
+  def __init__(self, title, youtube_id, timestamps, lines, lowered=None, words=None):
+    self.title = title
+    self.youtube_id = youtube_id
+    self.timestamps = timestamps
+    self.lines = lines
+    self.lowered = lowered if lowered is not None else [line.lower() for line in lines]
+    self.words = words
+
+
+"""
+An in-memory copy of a course created by subtitle_parser.py, read either from
+its json file or from a memory-mapped course file (see course_file.py), with
+the word timings of a word file next to it when there is one (see
+word_timings.py).
+
+Everything the search needs is split and normalized once here, so a query
+never has to parse json or match titles again. lowered holds the lowercased
+lines of the whole course, indexed by global line id; video_starts gives the
+first line id of each video.
+"""
+class CourseIndex(object):
+
+  def __init__(self, filename, mtime):
+    self.filename = filename
+    self.mtime = mtime
+    # changes whenever the course is rebuilt from a different file
+    self.version = (filename, mtime)
+    self.videos = []
+    self._trigrams = None
+    self._vocabulary = None
+    self._resident = None
+    if filename.endswith(COURSE_SUFFIX):
+      self._load_course_file(filename)
+    else:
+      self._load_json(filename)
+    self.video_starts = array("i", [0])
+    for video in self.videos:
+      self.video_starts.append(self.video_starts[-1] + len(video.lines))
+    if os.path.exists(words_path(filename)):
+      streams = WordFile(words_path(filename)).streams()
+      for video in self.videos:
+        video.words = streams.get(video.youtube_id)
+
+  def _load_json(self, filename):
+    with open(filename) as file:
+      data = json.load(file)
+    for video_title in data:
+      title_obj = title_matcher.match(video_title)
+      title, youtube_id = title_obj.group(1), title_obj.group(2)
+      video_data = data[video_title]
+      timestamps = sorted(video_data, key=int)
+      lines = [video_data[timestamp] for timestamp in timestamps]
+      self.videos.append(Video(title, youtube_id, array("i", map(int, timestamps)), lines))
+    self.lowered = [lowered for video in self.videos for lowered in video.lowered]
+
+  def _load_course_file(self, filename):
+    course_file = CourseFile(filename)
+    starts = course_file.video_starts
+    for video_idx in range(course_file.num_videos):
+      title, youtube_id = course_file.video(video_idx)
+      start, stop = starts[video_idx], starts[video_idx + 1]
+      self.videos.append(Video(title, youtube_id,
+        course_file.timestamps[start:stop],
+        View(course_file.line, start, stop),
+        View(course_file.lowered, start, stop)))
+    self.lowered = View(course_file.lowered, 0, course_file.num_lines)
+    self.course_file = course_file
+
+  def trigram_index(self):
+    """
+    Builds the course's TrigramIndex on first use
+    """
+    if self._trigrams is None:
+      self._trigrams = TrigramIndex(self)
+      self._resident = None
+    return self._trigrams
+
+  def vocabulary(self):
+    """
+    The course's Vocabulary, from its vocabulary file or counted on first use
+    """
+    if self._vocabulary is None:
+      self._vocabulary = course_vocabulary(self.filename, lambda: video_texts(self))
+      self._resident = None
+    return self._vocabulary
+
+  def resident_bytes(self):
+    """
+    Estimated bytes of memory held by the course: its lines, timestamps and
+    the indexes built so far. Lines of a course file are memory-mapped and
+    only their per-video Views are counted. Measured again after an index
+    is built.
+    """
+    if self._resident is None:
+      size = sys.getsizeof(self.videos) + sys.getsizeof(self.lowered) + sys.getsizeof(self.video_starts)
+      for video in self.videos:
+        size += sys.getsizeof(video.timestamps)
+        if isinstance(video.lines, list):
+          size += _strings_size(video.lines) + _strings_size(video.lowered)
+      if self._trigrams is not None:
+        size += _postings_size(self._trigrams.postings)
+        size += sys.getsizeof(self._trigrams.text) + sys.getsizeof(self._trigrams.lowered) + sys.getsizeof(self._trigrams.line_starts)
+      if self._vocabulary is not None and isinstance(self._vocabulary.data, bytes):
+        size += sys.getsizeof(self._vocabulary.data)
+      self._resident = size
+    return self._resident
+
+
+def _strings_size(strings):
+  return sys.getsizeof(strings) + sum(map(sys.getsizeof, strings))
+
+def _postings_size(postings):
+  return sys.getsizeof(postings) + sum(sys.getsizeof(key) + sys.getsizeof(ids) for key, ids in postings.items())
+
+
+"""
+Picks the file to load for a course json: a course file next to it (built by
+course_file.py or subtitle_parser.py --binary) when it is at least as new as
+the json, otherwise the json itself. Returns the path and its mtime.
+"""
+def _resolve(filename):
+  mtime = os.stat(filename).st_mtime_ns
+  if filename.endswith(".json"):
+    compiled = filename[:-len(".json")] + COURSE_SUFFIX
+    try:
+      compiled_mtime = os.stat(compiled).st_mtime_ns
+    except OSError:
+      return filename, mtime
+    if compiled_mtime >= mtime:
+      return compiled, compiled_mtime
+  return filename, mtime
+
+
+"""
+The CourseIndexes loaded in this process, keyed by course json filename, in
+least recently used order.
+
+With a budget (in bytes), every load drops the least recently used courses
+until the resident_bytes() of the rest fit it. Indexes are built after a
+course is returned, so their memory is counted from the next load on.
+Pinned courses are never dropped, and neither is the course being loaded,
+so a budget smaller than one course still serves it. Without a budget every
+course stays loaded.
+"""
+class CourseCache(object):
+
+  def __init__(self, budget=None):
+    self.budget = budget
+    self.loads = 0
+    self.evictions = 0
+    self._courses = OrderedDict()
+    self._pinned = set()
+    self._lock = threading.Lock()
+    self._load_lock = threading.Lock()
+
+  def get(self, filename):
+    """
+    The CourseIndex for a course json file, loaded at most once while it
+    stays in the cache. The file's mtime is checked on every call and the
+    course is reloaded when the file has been rewritten.
+    """
+    path, mtime = _resolve(filename)
+    with self._lock:
+      course = self._current(filename, path, mtime)
+    if course is None:
+      # one load at a time, without holding up courses that are loaded
+      with self._load_lock:
+        with self._lock:
+          course = self._current(filename, path, mtime)
+        if course is None:
+          course = CourseIndex(path, mtime)
+          with self._lock:
+            self._courses[filename] = course
+            self.loads += 1
+    with self._lock:
+      if filename in self._courses:
+        self._courses.move_to_end(filename)
+      self._evict(keep=filename)
+    return course
+
+  def _current(self, filename, path, mtime):
+    course = self._courses.get(filename)
+    if course is not None and course.filename == path and course.mtime == mtime:
+      return course
+    return None
+
+  def put(self, filename, course):
+    with self._lock:
+      self._courses[filename] = course
+      self._evict(keep=filename)
+
+  def discard(self, filename):
+    with self._lock:
+      self._courses.pop(filename, None)
+
+  def pin(self, filename):
+    """
+    Keeps a course loaded whatever the budget. The course is loaded by the
+    next get(), not here.
+    """
+    with self._lock:
+      self._pinned.add(filename)
+
+  def unpin(self, filename):
+    with self._lock:
+      self._pinned.discard(filename)
+
+  def _evict(self, keep):
+    if self.budget is None:
+      return
+    total = sum(course.resident_bytes() for course in self._courses.values())
+    for filename in list(self._courses):
+      if total <= self.budget:
+        break
+      if filename == keep or filename in self._pinned:
+        continue
+      total -= self._courses.pop(filename).resident_bytes()
+      self.evictions += 1
+
+  def resident(self):
+    """
+    Estimated resident bytes of every loaded course, least recently used
+    first
+    """
+    with self._lock:
+      return [(filename, course.resident_bytes()) for filename, course in self._courses.items()]
+
+  def stats(self):
+    resident = self.resident()
+    return {
+      "budget": self.budget,
+      "resident_bytes": sum(size for _, size in resident),
+      "courses": len(resident),
+      "pinned": len(self._pinned),
+      "loads": self.loads,
+      "evictions": self.evictions
+    }
+
+
+# the courses of this process; set courses.budget to limit their memory
+courses = CourseCache()
+
+"""
+Returns the CourseIndex for a course json file from the process's
+CourseCache, loading it when it is not resident.
+"""
+def load_course(filename):
+  return courses.get(filename)
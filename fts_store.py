@@ -0,0 +1,447 @@
+import os
+import sqlite3
+import sys
+import threading
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
+from course_file import View
+from course_index import CourseIndex, Video
+from inverted_index import top_hits
+from trigram_index import CONTEXT_CHARS, FUZZY_MIN_LENGTH, SPACES, context_window, fuzzy_pattern
+from vocabulary import course_vocabulary
+
+# prepared statements kept per connection (sqlite3 caches them by sql text)
+CACHED_STATEMENTS = 64
+# course metadata (videos, line ranges, not text) kept in memory per worker
+COURSE_CACHE_SIZE = 256
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS courses (
+  id INTEGER PRIMARY KEY,
+  slug TEXT UNIQUE NOT NULL,
+  title TEXT,
+  source TEXT,
+  mtime REAL,
+  first_line INTEGER,
+  num_lines INTEGER
+);
+CREATE TABLE IF NOT EXISTS videos (
+  id INTEGER PRIMARY KEY,
+  course_id INTEGER NOT NULL,
+  title TEXT,
+  youtube_id TEXT,
+  first_line INTEGER,
+  num_lines INTEGER
+);
+CREATE INDEX IF NOT EXISTS videos_course ON videos (course_id, first_line);
+CREATE TABLE IF NOT EXISTS lines (
+  id INTEGER PRIMARY KEY,
+  video_id INTEGER NOT NULL,
+  timestamp INTEGER,
+  text TEXT,
+  lowered TEXT
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS lines_fts USING fts5(
+  lowered, content='lines', content_rowid='id', tokenize='trigram case_sensitive 1'
+);
+"""
+
+COURSE_SQL = "SELECT id, title, source, mtime, first_line, num_lines FROM courses WHERE slug = ?"
+VIDEOS_SQL = "SELECT title, youtube_id, first_line, num_lines FROM videos WHERE course_id = ? ORDER BY first_line"
+LINE_SQL = "SELECT text FROM lines WHERE id = ?"
+LOWERED_SQL = "SELECT lowered FROM lines WHERE id = ?"
+TIMESTAMP_SQL = "SELECT timestamp FROM lines WHERE id = ?"
+MATCH_SQL = "SELECT rowid, lowered FROM lines_fts WHERE lines_fts MATCH ? AND rowid BETWEEN ? AND ? ORDER BY rowid"
+SCAN_SQL = "SELECT id, lowered FROM lines WHERE id BETWEEN ? AND ? ORDER BY id"
+MATCH_ENDS_SQL = ("SELECT id, lowered FROM lines WHERE id BETWEEN ? AND ? "
+  "AND (id IN (SELECT rowid FROM lines_fts WHERE lines_fts MATCH ?) OR %s) ORDER BY id")
+ENDS_SQL = "rtrim(lowered, ' ' || char(9, 10, 13)) LIKE ? ESCAPE '\\'"
+LENGTH_SQL = "SELECT coalesce(sum(length(lowered)), 0) FROM lines WHERE id BETWEEN ? AND ?"
+
+"""
+Courses stored in a SQLite database instead of in memory, for libraries too
+large to keep every course index resident.
+
+Every subtitle line is a row of lines, in the same course order as
+course_index, with an FTS5 trigram index over its lowercased text, so
+substring searches only read the lines that contain the phrase (or part of
+it, for phrases split over two lines). course(slug) returns a CourseIndex
+look-alike whose lines are read from the database on demand;
+phrase_occurrences accepts it in place of a json filename and finds the same
+matches as for the json, except for phrases running over three lines or more
+and short phrases split into two parts shorter than a trigram.
+
+Each thread of a worker opens its own connection, which keeps the prepared
+statements of the queries above.
+"""
+class FtsStore(object):
+
+  def __init__(self, path):
+    self.path = path
+    self._local = threading.local()
+    self._courses = OrderedDict()
+    self._lock = threading.Lock()
+    with self._connect() as connection:
+      connection.executescript(SCHEMA)
+
+  def _connect(self):
+    connection = sqlite3.connect(self.path, cached_statements=CACHED_STATEMENTS)
+    connection.execute("PRAGMA journal_mode=WAL")
+    return connection
+
+  @property
+  def connection(self):
+    connection = getattr(self._local, "connection", None)
+    if connection is None:
+      connection = self._local.connection = self._connect()
+    return connection
+
+  def ingest(self, slug, filename, title=None):
+    """
+    Stores the course json (or course file) created by subtitle_parser.py
+    under slug, replacing an earlier copy
+    """
+    mtime = os.path.getmtime(filename)
+    course = CourseIndex(filename, mtime)
+    connection = self.connection
+    with connection:
+      self._delete(connection, slug)
+      first_line = connection.execute("SELECT coalesce(max(id), 0) + 1 FROM lines").fetchone()[0]
+      num_lines = course.video_starts[-1]
+      course_id = connection.execute(
+        "INSERT INTO courses (slug, title, source, mtime, first_line, num_lines) VALUES (?, ?, ?, ?, ?, ?)",
+        (slug, title, filename, mtime, first_line, num_lines)).lastrowid
+      line_id = first_line
+      for video in course.videos:
+        video_id = connection.execute(
+          "INSERT INTO videos (course_id, title, youtube_id, first_line, num_lines) VALUES (?, ?, ?, ?, ?)",
+          (course_id, video.title, video.youtube_id, line_id, len(video.lines))).lastrowid
+        connection.executemany("INSERT INTO lines (id, video_id, timestamp, text, lowered) VALUES (?, ?, ?, ?, ?)",
+          zip(range(line_id, line_id + len(video.lines)), [video_id] * len(video.lines), video.timestamps, video.lines, video.lowered))
+        line_id += len(video.lines)
+      connection.execute("INSERT INTO lines_fts (rowid, lowered) SELECT id, lowered FROM lines WHERE id BETWEEN ? AND ?",
+        (first_line, first_line + num_lines - 1))
+    with self._lock:
+      self._courses.pop(slug, None)
+
+  def remove(self, slug):
+    connection = self.connection
+    with connection:
+      self._delete(connection, slug)
+    with self._lock:
+      self._courses.pop(slug, None)
+
+  def _delete(self, connection, slug):
+    row = connection.execute(COURSE_SQL, (slug,)).fetchone()
+    if row is None:
+      return
+    course_id, _, _, _, first_line, num_lines = row
+    last_line = first_line + num_lines - 1
+    connection.execute("DELETE FROM lines_fts WHERE rowid BETWEEN ? AND ?", (first_line, last_line))
+    connection.execute("DELETE FROM lines WHERE id BETWEEN ? AND ?", (first_line, last_line))
+    connection.execute("DELETE FROM videos WHERE course_id = ?", (course_id,))
+    connection.execute("DELETE FROM courses WHERE id = ?", (course_id,))
+
+  def slugs(self):
+    return [slug for slug, in self.connection.execute("SELECT slug FROM courses ORDER BY slug")]
+
+  def course(self, slug):
+    """
+    The stored course as an FtsCourse, or None if slug was never ingested
+    """
+    row = self.connection.execute(COURSE_SQL, (slug,)).fetchone()
+    if row is None:
+      return None
+    course_id, title, source, mtime, first_line, num_lines = row
+    with self._lock:
+      course = self._courses.get(slug)
+      if course is not None and course.version == (source, mtime):
+        self._courses.move_to_end(slug)
+        return course
+    course = FtsCourse(self, course_id, source, mtime, first_line, num_lines)
+    with self._lock:
+      self._courses[slug] = course
+      while len(self._courses) > COURSE_CACHE_SIZE:
+        self._courses.popitem(last=False)
+    return course
+
+  def _value(self, sql, line_id):
+    return self.connection.execute(sql, (line_id,)).fetchone()[0]
+
+
+"""
+A stored course with the attributes of CourseIndex that the searches in
+phrase_occurrences use. Only the list of videos is held in memory; lines,
+lowered lines and timestamps are Views that read single rows on access.
+Line ids are local to the course, as in CourseIndex.
+"""
+class FtsCourse(object):
+
+  def __init__(self, store, course_id, source, mtime, first_line, num_lines):
+    self.store = store
+    self.version = (source, mtime)
+    self.first_line = first_line
+    self.num_lines = num_lines
+    self.videos = []
+    self.video_starts = array("i", [0])
+    for title, youtube_id, video_first, video_lines in store.connection.execute(VIDEOS_SQL, (course_id,)):
+      start = video_first - first_line
+      self.videos.append(Video(title, youtube_id,
+        View(self._timestamp, start, start + video_lines),
+        View(self._line, start, start + video_lines),
+        View(self._lowered, start, start + video_lines)))
+      self.video_starts.append(start + video_lines)
+    self.source = source
+    self.lowered = View(self._lowered, 0, num_lines)
+    self._search = FtsSearch(self)
+    self._vocabulary = None
+
+  def _line(self, line_id):
+    return self.store._value(LINE_SQL, self.first_line + line_id)
+
+  def _lowered(self, line_id):
+    return self.store._value(LOWERED_SQL, self.first_line + line_id)
+
+  def _timestamp(self, line_id):
+    return self.store._value(TIMESTAMP_SQL, self.first_line + line_id)
+
+  def trigram_index(self):
+    return self._search
+
+  def vocabulary(self):
+    """
+    The vocabulary file of the course json, or the vocabulary counted from
+    the stored rows, one video at a time, when there is none
+    """
+    if self._vocabulary is None:
+      self._vocabulary = course_vocabulary(self.source, self._video_texts)
+    return self._vocabulary
+
+  def _video_texts(self):
+    connection = self.store.connection
+    for video_range in self._video_ranges():
+      yield "".join(_separated(lowered) for _, lowered in connection.execute(SCAN_SQL, video_range)).translate(SPACES)
+
+  def _video_ranges(self):
+    for video_idx in range(len(self.videos)):
+      yield self.first_line + self.video_starts[video_idx], self.first_line + self.video_starts[video_idx + 1] - 1
+
+
+"""
+The TrigramIndex interface of an FtsCourse, answered by the FTS5 index. Each
+row is matched together with the next row of its video, so a phrase split
+over two subtitle lines is found, but not one running over three.
+"""
+class FtsSearch(object):
+
+  def __init__(self, course):
+    self.course = course
+    self.video_starts = course.video_starts
+    self._video_lengths = None
+
+  def locate(self, line_id):
+    video_idx = bisect_right(self.video_starts, line_id) - 1
+    return video_idx, line_id - self.video_starts[video_idx]
+
+  @property
+  def video_lengths(self):
+    """
+    Characters of lowered text in each video, as TrigramIndex.video_lengths,
+    summed by SQLite on first use
+    """
+    if self._video_lengths is None:
+      connection = self.course.store.connection
+      self._video_lengths = [connection.execute(LENGTH_SQL, video_range).fetchone()[0]
+        for video_range in self.course._video_ranges()]
+    return self._video_lengths
+
+  def iter_find(self, needle, fuzzy=False, after=-1):
+    """
+    Yields (line id, start character, length) for the first match of the
+    lowercased needle starting in each line after the given line id, in
+    course order, like TrigramIndex.iter_find. A match may run on into the
+    next line of the same video but, unlike TrigramIndex, not past it.
+
+    The FTS5 index is asked for the rows holding any of the _fragments of
+    needle (or ending with one of its ends), and each is tried as the start
+    of a match together with the row before it. Rows are read as the caller consumes matches. Only needles
+    too short to use the index read every line of the course in order.
+    """
+    course = self.course
+    first = course.first_line + max(after + 1, 0)
+    last = course.first_line + course.num_lines - 1
+    pattern = None
+    if fuzzy and len(needle) >= FUZZY_MIN_LENGTH:
+      pattern = fuzzy_pattern(needle)
+    fragments = _fragments(needle, pattern is not None)
+    if fragments is not None:
+      pairs = self._matched_pairs(*fragments, first, last)
+    else:
+      pairs = self._scanned_pairs(first, last)
+    for line_id, line, following in pairs:
+      start, length = _first_match(needle, pattern, line, following)
+      if start != -1:
+        yield line_id - course.first_line, start, length
+
+  def _continues(self, line_id):
+    """
+    Whether the row after line_id belongs to the same video
+    """
+    local_id = line_id - self.course.first_line + 1
+    return local_id < self.course.num_lines and self.video_starts[bisect_right(self.video_starts, local_id) - 1] != local_id
+
+  def _matched_pairs(self, fragments, ends, first, last):
+    store = self.course.store
+    query = " OR ".join('"%s"' % fragment.replace('"', '""') for fragment in fragments)
+    if ends:
+      patterns = ["%" + end.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") for end in ends]
+      rows = store.connection.execute(MATCH_ENDS_SQL % " OR ".join([ENDS_SQL] * len(ends)), [first, last, query] + patterns)
+    else:
+      rows = store.connection.execute(MATCH_SQL, (query, first, last))
+    lines = {}
+    next_start = first
+    for line_id, lowered in rows:
+      lines[line_id] = lowered
+      for start in range(max(next_start, line_id - 1), line_id + 1):
+        following = None
+        if self._continues(start):
+          following = lines.get(start + 1)
+          if following is None:
+            following = lines[start + 1] = store._value(LOWERED_SQL, start + 1)
+        if start not in lines:
+          lines[start] = store._value(LOWERED_SQL, start)
+        yield start, lines[start], following
+      next_start = line_id + 1
+      # only rows after this one can be needed again
+      lines = {key: value for key, value in lines.items() if key > line_id}
+
+  def _scanned_pairs(self, first, last):
+    previous = None
+    for line_id, line in self.course.store.connection.execute(SCAN_SQL, (first, last)):
+      if previous is not None:
+        yield previous[0], previous[1], line if self._continues(previous[0]) else None
+      previous = line_id, line
+    if previous is not None:
+      yield previous[0], previous[1], None
+
+  def find(self, needle, fuzzy=False, videos=None):
+    hits = [self.locate(line_id) + (start, length) for line_id, start, length in self.iter_find(needle, fuzzy)]
+    if videos is not None:
+      hits = [hit for hit in hits if videos[hit[0]]]
+    return hits
+
+  def find_many(self, needles):
+    return [self.find(needle) for needle in needles]
+
+  def search(self, needle, limit, fuzzy=False):
+    """
+    Returns the limit best matches, ranked as TrigramIndex.search
+    """
+    return top_hits(self.find(needle, fuzzy), self.video_lengths, limit)
+
+  def snippet(self, line_id, start, length):
+    """
+    Same as TrigramIndex.snippet, cut from the line and as many of its
+    neighbours as the context can reach
+    """
+    video_idx, index = self.locate(line_id)
+    lines = self.course.videos[video_idx].lines
+    before = []
+    first_index = index
+    while first_index > 0 and sum(map(len, before)) <= CONTEXT_CHARS:
+      first_index -= 1
+      before.insert(0, _separated(lines[first_index]))
+    offset = sum(map(len, before)) + start
+    after = []
+    stop_index = index
+    while stop_index < len(lines) and sum(map(len, before + after)) <= offset + length + CONTEXT_CHARS:
+      after.append(_separated(lines[stop_index]))
+      stop_index += 1
+    text = "".join(before + after)
+    lo, hi = context_window(text.translate(SPACES), offset, length, 0, len(text))
+    first_line = line_id - index + first_index
+    line_start = 0
+    for line in before + after:
+      if line_start + len(line) > lo:
+        break
+      line_start += len(line)
+      first_line += 1
+    return text[lo:hi], offset - lo, first_line
+
+
+"""
+A line as it is joined to the next one in TrigramIndex's text
+"""
+def _separated(line):
+  if line and not line[-1].isspace():
+    line += "\n"
+  return line
+
+"""
+What to ask the FTS5 index for to find the lines matches of the lowercased
+needle start in, as (fragments, ends): every such line, or the line after
+it, holds one of the fragments or ends with one of the ends. None when
+needle is too short to use the index.
+
+A match either holds needle in one line or is split over a line and the
+next after one of its spaces, which the line break stands in for. Of the
+two parts of a split the longer one is a fragment when it has three
+characters or more, and otherwise the first part is an end. With fuzzy,
+one edit and one line break leave at least one third of needle as it is
+in one line, so the thirds are the fragments when each has three
+characters or more, or else the halves, which miss the matches whose
+unedited half is split over two lines. Fragments holding another fragment
+are left out, as they would only match rows that are matched already.
+"""
+def _fragments(needle, fuzzy):
+  ends = set()
+  if fuzzy:
+    third, half = len(needle) // 3, len(needle) // 2
+    fragments = {needle[:third].strip(), needle[third:2 * third].strip(), needle[2 * third:].strip()}
+    if min(map(len, fragments)) < 3:
+      fragments = {needle[:half].strip(), needle[half:].strip()}
+    if min(map(len, fragments)) < 3:
+      return None
+  else:
+    if len(needle.strip()) < 3:
+      return None
+    fragments = {needle.strip()}
+    for split in range(1, len(needle)):
+      if needle[split - 1] != " ":
+        continue
+      head, tail = needle[:split].strip(), needle[split:].strip()
+      if max(len(head), len(tail)) >= 3:
+        fragments.add(max(head, tail, key=len))
+      elif head and tail:
+        ends.add(head)
+  fragments = [fragment for fragment in fragments if not any(other != fragment and other in fragment for other in fragments)]
+  return sorted(fragments), sorted(ends)
+
+"""
+(start, length) of the first match of needle (or within one edit of it, with
+pattern) starting in line, which may run on into the following line, or
+(-1, 0)
+"""
+def _first_match(needle, pattern, line, following):
+  line = _separated(line)
+  text = line + following if following is not None else line
+  text = text.translate(SPACES)
+  start, length = text.find(needle), len(needle)
+  if (start == -1 or start >= len(line)) and pattern is not None:
+    match = pattern.search(text)
+    start, length = (match.start(), match.end() - match.start()) if match is not None else (-1, 0)
+  return (start, length) if -1 < start < len(line) else (-1, 0)
+
+if __name__ == '__main__':
+  args = sys.argv
+  assert len(args) >= 3, "Must provide database and course json files"
+  store = FtsStore(args[1])
+  for filename in args[2:]:
+    base = os.path.splitext(filename)[0]
+    title = None
+    if os.path.exists(base + ".txt"):
+      with open(base + ".txt") as file:
+        title = file.read()
+    store.ingest(os.path.basename(base), filename, title)
+    print(os.path.basename(base))
@@ -0,0 +1,85 @@
+import heapq
+import os
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait
+from itertools import islice
+from phrase_occurrences import scored_occurrences
+
+# seconds a global search waits for the courses before answering without the rest
+DEADLINE = 2.0
+# courses searched at the same time
+WORKERS = min(4, os.cpu_count() or 1)
+
+# one result of a search across courses
+GlobalHit = namedtuple("GlobalHit", ["course", "score", "occurrence"])
+
+"""
+Searches a phrase in every course at once.
+
+Each course is searched for its best hits on a pool of threads of this
+process, so they search the same course indexes (or FTS store) as the
+per-course searches, within the same memory budget. The per-course results,
+each sorted by BM25 score, are merged with a heap into the overall best.
+Courses that have not answered by the deadline are left out and reported,
+so one slow course cannot hold up the response. A search that already runs
+cannot be stopped, so a slow course keeps its thread busy after the
+deadline; searches still queued once their deadline has passed return at
+once without searching, so later searches do not wait behind work nobody is
+waiting for.
+"""
+class GlobalSearch(object):
+
+  def __init__(self, workers=WORKERS, deadline=DEADLINE):
+    self.workers = workers
+    self.deadline = deadline
+    self._executor = None
+    self._lock = threading.Lock()
+
+  def start(self):
+    """
+    The thread pool, started on first use
+    """
+    with self._lock:
+      if self._executor is None:
+        self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="global-search")
+      return self._executor
+
+  def search(self, phrase, courses, limit, fuzzy=False):
+    """
+    Returns the limit best GlobalHits for phrase over courses, given as
+    (slug, source) pairs where source is what phrase_occurrences searches:
+    a course json filename or a loaded course such as an FtsCourse, and the
+    slugs of the courses that were skipped because they missed the deadline
+    or failed
+    """
+    executor = self.start()
+    deadline = time.time() + self.deadline
+    futures = {executor.submit(_search_course, source, phrase, limit, fuzzy, deadline): slug for slug, source in courses}
+    done, pending = wait(futures, timeout=self.deadline)
+    for future in pending:
+      future.cancel()
+    skipped = [futures[future] for future in pending]
+    ranked = []
+    for future in done:
+      slug = futures[future]
+      try:
+        ranked.append([GlobalHit(slug, score, occurrence) for score, occurrence in future.result()])
+      except Exception:
+        skipped.append(slug)
+    merged = heapq.merge(*ranked, key=lambda hit: (-hit.score, hit.course, hit.occurrence.cursor))
+    return list(islice(merged, limit)), sorted(skipped)
+
+  def close(self):
+    with self._lock:
+      if self._executor is not None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
+
+
+def _search_course(source, phrase, limit, fuzzy, deadline):
+  if time.time() > deadline:
+    # the search has already answered without this course
+    return []
+  return scored_occurrences(phrase, source, limit, fuzzy)
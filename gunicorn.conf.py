@@ -0,0 +1,5 @@
+# voice search sessions live in one process, so one worker serves requests from threads
+worker_class = "gthread"
+workers = 1
+threads = 32
+wsgi_app = "wsgi:app"
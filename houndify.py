@@ -1,11 +1,13 @@
 ##############################################################################
 # Copyright 2019 SoundHound, Incorporated.  All rights reserved.
 ##############################################################################
+import asyncio
 import base64
 import hashlib
 import hmac
 import http.client
 import json
+import ssl
 import threading
 import time
 import uuid
@@ -23,11 +25,14 @@ HOUND_SERVER = "api.houndify.com"
 TEXT_ENDPOINT = "/v1/text"
 VOICE_ENDPOINT = "/v1/audio"
 VERSION = "1.2.5"
+CRLF = b"\r\n"
+# idle keep-alive connections kept by a text client
+POOL_SIZE = 4
 
 
 class _BaseHoundClient(object):
 
-    def __init__(self, clientID, clientKey, userID, hostname, proxyHost, proxyPort, proxyHeaders):
+    def __init__(self, clientID, clientKey, userID, hostname, proxyHost, proxyPort, proxyHeaders, port = None, https = True):
       self.clientID = clientID
       self.clientKey = base64.urlsafe_b64decode(clientKey)
       self.userID = userID
@@ -35,6 +40,8 @@ class _BaseHoundClient(object):
       self.proxyHost = proxyHost
       self.proxyPort = proxyPort
       self.proxyHeaders = proxyHeaders
+      self.port = port
+      self.https = https
       self.gzip = True
       
       self.HoundRequestInfo = {
@@ -109,14 +116,55 @@ class _BaseHoundClient(object):
       return headers
 
 
+    def _connect(self):
+      if self.proxyHost:
+        conn = http.client.HTTPSConnection(self.proxyHost, self.proxyPort)
+        conn.set_tunnel(self.hostname, self.port, headers = self.proxyHeaders) 
+      elif self.https:
+        conn = http.client.HTTPSConnection(self.hostname, self.port)
+      else:
+        conn = http.client.HTTPConnection(self.hostname, self.port)
+      return conn
+
+
+    async def _openStream(self):
+      """
+      asyncio counterpart of _connect, returning a (reader, writer) pair
+      """
+      context = ssl.create_default_context() if self.https else None
+      port = self.port or (443 if self.https else 80)
+      if not self.proxyHost:
+        return await asyncio.open_connection(self.hostname, port, ssl = context)
+
+      reader, writer = await asyncio.open_connection(self.proxyHost, self.proxyPort or 443)
+      request = "CONNECT %s:%d HTTP/1.1\r\nHost: %s:%d\r\n" % (self.hostname, port, self.hostname, port)
+      for header, value in (self.proxyHeaders or {}).items():
+        request += "%s: %s\r\n" % (header, value)
+      writer.write((request + "\r\n").encode("latin-1"))
+      status, _ = await _readHead(reader)
+      if status != 200:
+        writer.close()
+        raise OSError("Tunnel connection failed: %d" % status)
+      if context:
+        await writer.start_tls(context, server_hostname = self.hostname)
+      return reader, writer
+
+
+    def _hostHeader(self):
+      if self.port is None:
+        return self.hostname
+      return "%s:%d" % (self.hostname, self.port)
+
+
 
 class TextHoundClient(_BaseHoundClient):
     """
     TextHoundClient is used for making text queries for Hound
     """
-    def __init__(self, clientID, clientKey, userID, requestInfo = dict(), hostname = HOUND_SERVER, proxyHost = None, proxyPort = None, proxyHeaders = None):
-      _BaseHoundClient.__init__(self, clientID, clientKey, userID, hostname, proxyHost, proxyPort, proxyHeaders)
+    def __init__(self, clientID, clientKey, userID, requestInfo = dict(), hostname = HOUND_SERVER, proxyHost = None, proxyPort = None, proxyHeaders = None, port = None, https = True, poolSize = POOL_SIZE):
+      _BaseHoundClient.__init__(self, clientID, clientKey, userID, hostname, proxyHost, proxyPort, proxyHeaders, port, https)
       self.HoundRequestInfo.update(requestInfo)
+      self.pool = _ConnectionPool(self._connect, poolSize)
     
 
     def query(self, query):
@@ -124,29 +172,99 @@ class TextHoundClient(_BaseHoundClient):
       Make a text query to Hound.
 
       query is the string of the query
+
+      Connections are kept alive and reused by later queries; a query on a
+      reused connection that the server has closed in the meantime is retried
+      once on a new one.
       """
       headers = self._generateHeaders(self.HoundRequestInfo)
       if self.gzip:
         headers["Hound-Response-Accept-Encoding"] = "gzip";
 
-      if self.proxyHost:
-        conn = http.client.HTTPSConnection(self.proxyHost, self.proxyPort)
-        conn.set_tunnel(self.hostname, headers = self.proxyHeaders) 
+      while True:
+        conn, reused = self.pool.acquire()
+        try:
+          conn.request("GET", TEXT_ENDPOINT + "?query=" + urllib.parse.quote(query), headers = headers)
+          resp = conn.getresponse()
+          raw_response = resp.read()
+        except (http.client.HTTPException, ConnectionError):
+          conn.close()
+          if reused:
+            continue
+          raise
+        break
+
+      if resp.will_close:
+        conn.close()
       else:
-        conn = http.client.HTTPSConnection(self.hostname)
-      
-      conn.request("GET", TEXT_ENDPOINT + "?query=" + urllib.parse.quote(query), headers = headers)
-      resp = conn.getresponse()
+        self.pool.release(conn)
+      return _decodeResponse(raw_response, self.gzip)
 
-      raw_response = resp.read()
 
-      try:
-        if self.gzip:
-          raw_response = gzip.decompress(raw_response)
-        raw_response = raw_response.decode("utf-8")
-        return json.loads(raw_response)
-      except:
-        return { "Error": raw_response }
+    def close(self):
+      """
+      Closes the idle connections
+      """
+      self.pool.close()
+
+
+
+class AsyncTextHoundClient(_BaseHoundClient):
+    """
+    AsyncTextHoundClient makes the same text queries as TextHoundClient from
+    a coroutine, keeping up to poolSize idle keep-alive connections
+    """
+    def __init__(self, clientID, clientKey, userID, requestInfo = dict(), hostname = HOUND_SERVER, proxyHost = None, proxyPort = None, proxyHeaders = None, port = None, https = True, poolSize = POOL_SIZE):
+      _BaseHoundClient.__init__(self, clientID, clientKey, userID, hostname, proxyHost, proxyPort, proxyHeaders, port, https)
+      self.HoundRequestInfo.update(requestInfo)
+      self.poolSize = poolSize
+      self._idle = []
+
+
+    async def query(self, query):
+      """
+      Make a text query to Hound.
+
+      query is the string of the query
+      """
+      headers = self._generateHeaders(self.HoundRequestInfo)
+      if self.gzip:
+        headers["Hound-Response-Accept-Encoding"] = "gzip";
+      request = _requestHead("GET", TEXT_ENDPOINT + "?query=" + urllib.parse.quote(query), self._hostHeader(), headers)
+
+      while True:
+        reused = bool(self._idle)
+        reader, writer = self._idle.pop() if reused else await self._openStream()
+        try:
+          writer.write(request)
+          await writer.drain()
+          status, response_headers = await _readHead(reader)
+          raw_response = b"".join([chunk async for chunk in _iterBody(reader, response_headers)])
+        except (http.client.HTTPException, ConnectionError, asyncio.IncompleteReadError):
+          writer.close()
+          if reused:
+            continue
+          raise
+        break
+
+      if _keepAlive(response_headers) and len(self._idle) < self.poolSize:
+        self._idle.append((reader, writer))
+      else:
+        writer.close()
+      return _decodeResponse(raw_response, self.gzip)
+
+
+    async def close(self):
+      """
+      Closes the idle connections
+      """
+      while self._idle:
+        _, writer = self._idle.pop()
+        writer.close()
+        try:
+          await writer.wait_closed()
+        except OSError:
+          pass
 
 
 
@@ -182,12 +300,12 @@ class StreamingHoundClient(_BaseHoundClient):
     StreamingHoundClient is used to send streaming audio to the Hound
     server and receive live transcriptions back
     """
-    def __init__(self, clientID, clientKey, userID, requestInfo = dict(), hostname = HOUND_SERVER, sampleRate = 16000, enableVAD = True, useSpeex = False, proxyHost = None, proxyPort = None, proxyHeaders = None):
+    def __init__(self, clientID, clientKey, userID, requestInfo = dict(), hostname = HOUND_SERVER, sampleRate = 16000, enableVAD = True, useSpeex = False, proxyHost = None, proxyPort = None, proxyHeaders = None, port = None, https = True):
       """
       clientID and clientKey are "Client ID" and "Client Key" 
       from the Houndify.com web site.
       """
-      _BaseHoundClient.__init__(self, clientID, clientKey, userID, hostname, proxyHost, proxyPort, proxyHeaders)
+      _BaseHoundClient.__init__(self, clientID, clientKey, userID, hostname, proxyHost, proxyPort, proxyHeaders, port, https)
       
       self.sampleRate = sampleRate
       self.useSpeex = useSpeex
@@ -216,34 +334,47 @@ class StreamingHoundClient(_BaseHoundClient):
 
       listener is a HoundListener (or derived class) object
       """
+      self._reset()
+
+      self.conn = self._connect()
+      self.conn.putrequest("POST", VOICE_ENDPOINT)
+
+      headers = self._requestHeaders()
+      for header in headers:
+        self.conn.putheader(header, headers[header])
+      self.conn.endheaders()
+      
+      self.callbackTID = threading.Thread(target = self._callback, args = (listener,))
+      self.callbackTID.start()
+
+      self._send(self._audioHeader())
+
+
+    def _reset(self):
       self.audioFinished = False
       self.lastResult = None
-      self.buffer = bytes()
 
-      if self.proxyHost:
-        self.conn = http.client.HTTPSConnection(self.proxyHost, self.proxyPort)
-        self.conn.set_tunnel(self.hostname, headers = self.proxyHeaders) 
-      else:
-        self.conn = http.client.HTTPSConnection(self.hostname)
+      # 20ms 16-bit audio frame = (2 * 0.02 * sampleRate) bytes
+      # audio short of a whole frame waits in self.buffer until the next fill()
+      self.frameSize = int(2 * 0.02 * self.sampleRate)
+      self.buffer = bytearray(self.frameSize)
+      self.buffered = 0
+      self._chunkHeaders = {}
+      self._out = bytearray()
 
-      self.conn.putrequest("POST", VOICE_ENDPOINT)
 
+    def _requestHeaders(self):
       headers = self._generateHeaders(self.HoundRequestInfo)
       headers["Transfer-Encoding"] = "chunked";
       if self.gzip:
         headers["Hound-Response-Accept-Encoding"] = "gzip";
+      return headers
 
-      for header in headers:
-        self.conn.putheader(header, headers[header])
-      self.conn.endheaders()
-      
-      self.callbackTID = threading.Thread(target = self._callback, args = (listener,))
-      self.callbackTID.start()
 
-      audio_header = self._wavHeader(self.sampleRate)
+    def _audioHeader(self):
       if self.useSpeex:
-        audio_header = pySHSpeex.Init(self.sampleRate == 8000)
-      self._send(audio_header)
+        return pySHSpeex.Init(self.sampleRate == 8000)
+      return self._wavHeader(self.sampleRate)
 
       
     def fill(self, data):
@@ -254,24 +385,57 @@ class StreamingHoundClient(_BaseHoundClient):
       data is 16-bit, 8 KHz/16 KHz little-endian PCM samples.
       Returns True if the server detected the end of audio and is processing the data
       or False if the server is still accepting audio
+
+      Whole frames are sent straight out of data without copying it; only
+      the part of a frame left over at either end goes through self.buffer.
       """
       # buffer gets flushed on next call to start()
       if self.audioFinished and self.enableVAD:
         return True
 
-      self.buffer += data
+      self._sendFrames(data)
+      return False
 
-      # 20ms 16-bit audio frame = (2 * 0.02 * sampleRate) bytes
-      frame_size = int(2 * 0.02 * self.sampleRate)
-      while len(self.buffer) >= frame_size:
-        frame = self.buffer[:frame_size]
-        self.buffer = self.buffer[frame_size:]
-        if self.useSpeex:
-          frame = pySHSpeex.EncodeFrame(frame)
-        
-        self._send(frame)   
 
-      return False
+    def _sendFrames(self, data):
+      data = memoryview(data).cast("B")
+      frame_size = self.frameSize
+      offset = 0
+      if self.buffered:
+        offset = min(frame_size - self.buffered, len(data))
+        self.buffer[self.buffered:self.buffered + offset] = data[:offset]
+        self.buffered += offset
+        if self.buffered < frame_size:
+          return
+        self._sendFrame(self.buffer)
+        self.buffered = 0
+
+      end = len(data) - (len(data) - offset) % frame_size
+      while offset < end:
+        self._sendFrame(data[offset:offset + frame_size])
+        offset += frame_size
+
+      if end < len(data):
+        self.buffered = len(data) - end
+        self.buffer[:self.buffered] = data[end:]
+
+
+    def _sendFrame(self, frame):
+      if self.useSpeex:
+        frame = pySHSpeex.EncodeFrame(bytes(frame))
+      self._send(frame)
+
+
+    def _sendRest(self):
+      if self.buffered > 0:
+        frame = self.buffer[:self.buffered]
+        if self.useSpeex:
+          padding_size = self.frameSize - self.buffered
+          frame = frame + b'\x00' * padding_size
+          frame = pySHSpeex.EncodeFrame(bytes(frame))
+          
+        self._send(frame)
+        self.buffered = 0
 
 
     def finish(self):
@@ -283,15 +447,7 @@ class StreamingHoundClient(_BaseHoundClient):
       start() call should have a corresponding finish() to wait for the threads
       """
 
-      if len(self.buffer) > 0:
-        frame = self.buffer
-        if self.useSpeex:
-          padding_size = int(2 * 0.02 * self.sampleRate) - len(self.buffer)
-          frame = frame + b'\x00' * padding_size
-          frame = pySHSpeex.EncodeFrame(frame)
-          
-        self._send(frame)
-
+      self._sendRest()
       self._send("")
       self.callbackTID.join()
       return self.lastResult
@@ -299,11 +455,10 @@ class StreamingHoundClient(_BaseHoundClient):
 
     def _callback(self, listener):
       headers = ""
-      body = ""
+      body = []
       is_chunked = False
       chunk_size = None
       content_length = None
-      transcripts_done = False
       headers_done = False
 
       gen = self._readline(self.conn.sock)
@@ -330,7 +485,7 @@ class StreamingHoundClient(_BaseHoundClient):
             chunk_size = content_length
           continue
 
-        body += line
+        body.append(line)
 
         if is_chunked and chunk_size is None:
           chunk_size = int(line, 16)
@@ -343,25 +498,37 @@ class StreamingHoundClient(_BaseHoundClient):
         except:
           break
 
-        if "Status" in parsedMsg and parsedMsg["Status"] == "Error":
+        if self._onMessage(parsedMsg, listener):
+          return
+
+      self._onBrokenResponse("".join(body), listener)
+
+
+    def _onMessage(self, parsedMsg, listener):
+      """
+      Passes one message from the server on to listener. Returns True once
+      the request is over.
+      """
+      if "Status" in parsedMsg and parsedMsg["Status"] == "Error":
+        self.lastResult = parsedMsg
+        listener.onError(parsedMsg)  
+        self.audioFinished = True
+        return True
+
+      if "Format" in parsedMsg:
+        if parsedMsg["Format"] == "SoundHoundVoiceSearchParialTranscript" or parsedMsg["Format"] == "HoundVoiceQueryPartialTranscript":
+          listener.onPartialTranscript(parsedMsg["PartialTranscript"])
+          if "SafeToStopAudio" in parsedMsg and parsedMsg["SafeToStopAudio"]:
+            self.audioFinished = True
+
+        if parsedMsg["Format"] == "SoundHoundVoiceSearchResult" or parsedMsg["Format"] == "HoundQueryResult":
           self.lastResult = parsedMsg
-          listener.onError(parsedMsg)  
-          self.audioFinished = True
-          return     
-
-        if "Format" in parsedMsg:
-          if parsedMsg["Format"] == "SoundHoundVoiceSearchParialTranscript" or parsedMsg["Format"] == "HoundVoiceQueryPartialTranscript":
-            listener.onPartialTranscript(parsedMsg["PartialTranscript"])
-            if "SafeToStopAudio" in parsedMsg and parsedMsg["SafeToStopAudio"]:
-              self.audioFinished = True
-            if "Done" in parsedMsg and parsedMsg["Done"]:
-              transcripts_done = True
-
-          if parsedMsg["Format"] == "SoundHoundVoiceSearchResult" or parsedMsg["Format"] == "HoundQueryResult":
-            self.lastResult = parsedMsg
-            listener.onFinalResponse(parsedMsg)
-            return
+          listener.onFinalResponse(parsedMsg)
+          return True
+      return False
 
+
+    def _onBrokenResponse(self, body, listener):
       self.lastResult = { "Error": body }
       listener.onError({ "Error": body })
       self.audioFinished = True
@@ -386,44 +553,283 @@ class StreamingHoundClient(_BaseHoundClient):
 
 
     def _send(self, msg):
+      """
+      Sends msg as one chunk of the chunked request body. The chunk size line,
+      msg and the closing CRLF go out in one vectored write, or through one
+      reused buffer on sockets without sendmsg: TLS sockets, and every socket
+      on Windows.
+      """
       if self.conn:
         if (isinstance(msg, str)): 
           msg = msg.encode("utf-8")
-        chunk_size = "%x\r\n" % len(msg)
+        size = len(msg)
+        chunk_size = self._chunkHeaders.get(size)
+        if chunk_size is None:
+          chunk_size = self._chunkHeaders[size] = ("%x\r\n" % size).encode("utf-8")
         try:
-          self.conn.send(chunk_size.encode("utf-8"))
-          self.conn.send(msg + "\r\n".encode("utf-8"))
+          sock = self.conn.sock
+          if isinstance(sock, ssl.SSLSocket) or not hasattr(sock, "sendmsg"):
+            self._out = _sendJoined(sock, (chunk_size, msg, CRLF), self._out)
+          else:
+            _sendVectored(sock, [chunk_size, msg, CRLF])
         except:
           self.conn.close()
           self.conn = None
 
 
     def _readline(self, socket):
+      """
+      Yields the CRLF terminated lines of the response, or the next chunk_size
+      bytes when a chunk size is sent in. Received data is appended to one
+      buffer, consumed by moving an offset forward and trimmed from the front
+      before the next read, so nothing is re-sliced per line.
+      """
       response_buffer = bytearray()
+      start = 0
       chunk_size = None
-      separator = "\r\n".encode("utf-8")
-      msg_size = 4096
+      incoming = bytearray(65536)
+      incoming_view = memoryview(incoming)
 
       while True:
-        msg = socket.recv(msg_size)
-        if not msg: break
-        
-        response_buffer += msg
+        received = socket.recv_into(incoming)
+        if not received: break
+
+        del response_buffer[:start]
+        start = 0
+        response_buffer += incoming_view[:received]
  
         while True:
           if chunk_size is not None:
-            if len(response_buffer) < (chunk_size+2): break
-            chunk = response_buffer[:chunk_size]
-            response_buffer = response_buffer[chunk_size+2:]
+            end = start + chunk_size
+            if len(response_buffer) < end + 2: break
+            chunk = response_buffer[start:end]
+            start = end + 2
 
           else:
-            split_buffer = response_buffer.split(separator, 1)
-            if len(split_buffer) == 1: break
-            chunk = split_buffer[0]
-            response_buffer = split_buffer[1]
+            end = response_buffer.find(CRLF, start)
+            if end < 0: break
+            chunk = response_buffer[start:end]
+            start = end + 2
 
           chunk_size = yield chunk
 
-      if response_buffer: yield response_buffer
+      if start < len(response_buffer): yield response_buffer[start:]
+
+
 
-      
\ No newline at end of file
+class AsyncStreamingHoundClient(StreamingHoundClient):
+    """
+    AsyncStreamingHoundClient streams audio like StreamingHoundClient from
+    coroutines on an asyncio event loop, reading the server's responses in a
+    task instead of a thread per utterance. Each client carries one
+    utterance at a time; create one client per concurrent query.
+    """
+    async def start(self, listener=HoundListener()):
+      """
+      Connects to the server and sends the request headers and audio header.
+
+      listener is a HoundListener (or derived class) object
+      """
+      self._reset()
+      self.reader, self.writer = await self._openStream()
+      self.writer.write(_requestHead("POST", VOICE_ENDPOINT, self._hostHeader(), self._requestHeaders()))
+      self.callbackTask = asyncio.ensure_future(self._callback(listener))
+      self._send(self._audioHeader())
+      await self._drain()
+
+
+    async def fill(self, data):
+      """
+      Same as StreamingHoundClient.fill, waiting until the connection has
+      room for more audio
+      """
+      if self.audioFinished and self.enableVAD:
+        return True
+
+      self._sendFrames(data)
+      await self._drain()
+      return False
+
+
+    async def finish(self):
+      """
+      Sends the rest of the audio and returns the final response once the
+      server has sent it
+      """
+      self._sendRest()
+      self._send("")
+      await self._drain()
+      await self.callbackTask
+      if self.writer:
+        self.writer.close()
+        self.writer = None
+      return self.lastResult
+
+
+    def _send(self, msg):
+      """
+      Queues one chunk on the transport. The chunk is joined into a new bytes
+      object because the transport may hold on to it after fill() returns,
+      while the caller's data and self.buffer are reused.
+      """
+      if self.writer:
+        if (isinstance(msg, str)): 
+          msg = msg.encode("utf-8")
+        size = len(msg)
+        chunk_size = self._chunkHeaders.get(size)
+        if chunk_size is None:
+          chunk_size = self._chunkHeaders[size] = ("%x\r\n" % size).encode("utf-8")
+        self.writer.write(b"".join((chunk_size, msg, CRLF)))
+
+
+    async def _drain(self):
+      if self.writer:
+        try:
+          await self.writer.drain()
+        except ConnectionError:
+          self.writer.close()
+          self.writer = None
+
+
+    async def _callback(self, listener):
+      body = []
+      try:
+        status, headers = await _readHead(self.reader)
+        async for chunk in _iterBody(self.reader, headers):
+          if self.gzip and chunk[:3] == b"\x1f\x8b\x08":
+            chunk = gzip.decompress(chunk)
+          body.append(chunk.decode("utf-8"))
+          try:
+            parsedMsg = json.loads(chunk)
+          except ValueError:
+            break
+          if self._onMessage(parsedMsg, listener):
+            return
+      except (http.client.HTTPException, ConnectionError, asyncio.IncompleteReadError, ValueError):
+        pass
+      self._onBrokenResponse("".join(body), listener)
+
+
+
+class _ConnectionPool(object):
+    """
+    Idle keep-alive connections to one server, reused last in first out
+    """
+    def __init__(self, connect, maxSize):
+      self.connect = connect
+      self.maxSize = maxSize
+      self._idle = []
+      self._lock = threading.Lock()
+
+
+    def acquire(self):
+      """
+      Returns an idle connection or a new one, and whether it was reused
+      """
+      with self._lock:
+        if self._idle:
+          return self._idle.pop(), True
+      return self.connect(), False
+
+
+    def release(self, conn):
+      with self._lock:
+        if len(self._idle) < self.maxSize:
+          self._idle.append(conn)
+          return
+      conn.close()
+
+
+    def close(self):
+      with self._lock:
+        idle, self._idle = self._idle, []
+      for conn in idle:
+        conn.close()
+
+
+
+def _decodeResponse(raw_response, compressed):
+  try:
+    if compressed:
+      raw_response = gzip.decompress(raw_response)
+    raw_response = raw_response.decode("utf-8")
+    return json.loads(raw_response)
+  except:
+    return { "Error": raw_response }
+
+
+def _requestHead(method, path, host, headers):
+  lines = ["%s %s HTTP/1.1" % (method, path), "Host: " + host]
+  lines.extend("%s: %s" % (header, value) for header, value in headers.items())
+  return ("\r\n".join(lines) + "\r\n\r\n").encode("utf-8")
+
+
+async def _readHead(reader):
+  """
+  Reads the status line and headers of a response. Header names are lowercased.
+  """
+  status_line = await reader.readline()
+  if not status_line:
+    raise http.client.RemoteDisconnected("Remote end closed connection without response")
+  status = int(status_line.split(None, 2)[1])
+  headers = {}
+  while True:
+    line = await reader.readline()
+    if line in (b"\r\n", b"\n", b""):
+      return status, headers
+    header, _, value = line.decode("latin-1").partition(":")
+    headers[header.strip().lower()] = value.strip()
+
+
+async def _iterBody(reader, headers):
+  """
+  Yields every chunk of a chunked response body, or the whole body otherwise
+  """
+  if headers.get("transfer-encoding", "").lower() == "chunked":
+    while True:
+      size = int((await reader.readline()).split(b";", 1)[0], 16)
+      if size == 0:
+        await reader.readline()
+        return
+      chunk = await reader.readexactly(size)
+      await reader.readexactly(2)
+      yield chunk
+  elif "content-length" in headers:
+    yield await reader.readexactly(int(headers["content-length"]))
+  else:
+    yield await reader.read()
+
+
+def _keepAlive(headers):
+  if headers.get("connection", "").lower() == "close":
+    return False
+  return headers.get("transfer-encoding", "").lower() == "chunked" or "content-length" in headers
+
+
+def _sendVectored(sock, buffers):
+  total = sum(len(buffer) for buffer in buffers)
+  sent = sock.sendmsg(buffers)
+  while sent < total:
+    rest = []
+    for buffer in buffers:
+      if sent >= len(buffer):
+        sent -= len(buffer)
+      else:
+        rest.append(memoryview(buffer)[sent:])
+        sent = 0
+    buffers = rest
+    total = sum(len(buffer) for buffer in buffers)
+    sent = sock.sendmsg(buffers)
+
+
+def _sendJoined(sock, buffers, out):
+  size = sum(len(buffer) for buffer in buffers)
+  if len(out) < size:
+    out = bytearray(size)
+  offset = 0
+  for buffer in buffers:
+    out[offset:offset + len(buffer)] = buffer
+    offset += len(buffer)
+  with memoryview(out) as view:
+    sock.sendall(view[:size])
+  return out
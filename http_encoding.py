@@ -0,0 +1,79 @@
+import gzip
+import hashlib
+import zlib
+
+try:
+  import brotli
+except ImportError:
+  brotli = None
+
+# bodies smaller than this are sent uncompressed
+MIN_COMPRESS_SIZE = 512
+# lines of a streamed body compressed together before they are flushed
+STREAM_FLUSH_LINES = 16
+
+"""
+Response compression and validators for the JSON API.
+
+gzip is always available; brotli is used when the brotli package is installed
+and the client accepts it.
+"""
+
+def choose_encoding(accept_encoding):
+  """
+  The best content coding in an Accept-Encoding header, or None for identity
+  """
+  accepted = {}
+  for item in (accept_encoding or "").split(","):
+    coding, _, params = item.strip().partition(";")
+    quality = 1.0
+    params = params.strip()
+    if params.startswith("q="):
+      try:
+        quality = float(params[2:])
+      except ValueError:
+        quality = 0.0
+    accepted[coding.strip().lower()] = quality
+  for coding in ("br", "gzip"):
+    if coding == "br" and brotli is None:
+      continue
+    if accepted.get(coding, accepted.get("*", 0)) > 0:
+      return coding
+  return None
+
+def compress(data, encoding):
+  if encoding == "br":
+    return brotli.compress(data)
+  if encoding == "gzip":
+    return gzip.compress(data, mtime=0)
+  return data
+
+def compress_stream(chunks, encoding):
+  """
+  Compresses an iterable of byte strings as one stream, flushing every
+  STREAM_FLUSH_LINES chunks so the client can decode lines as they arrive
+  """
+  if encoding is None:
+    yield from chunks
+    return
+  if encoding == "br":
+    compressor = brotli.Compressor()
+    process, flush, finish = compressor.process, compressor.flush, compressor.finish
+  else:
+    compressor = zlib.compressobj(wbits=31)
+    process, finish = compressor.compress, compressor.flush
+    flush = lambda: compressor.flush(zlib.Z_SYNC_FLUSH)
+  for count, chunk in enumerate(chunks, 1):
+    data = process(chunk)
+    if count % STREAM_FLUSH_LINES == 0:
+      data += flush()
+    if data:
+      yield data
+  yield finish()
+
+def strong_etag(*parts):
+  """
+  An ETag for a representation determined by parts, such as the course index
+  version, the query and the content coding
+  """
+  return hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()
@@ -0,0 +1,51 @@
+import heapq
+import math
+import re
+
+token_matcher = re.compile("[a-z0-9']+")
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+"""
+Splits lowercased text into search tokens.
+"""
+def tokenize(text):
+  return token_matcher.findall(text)
+
+
+"""
+BM25 score of every lecture that contains the query, treating the whole
+query as a single term. term_freqs maps video index -> number of hits.
+"""
+def bm25_scores(term_freqs, video_lengths):
+  num_videos = len(video_lengths)
+  avg_length = float(sum(video_lengths)) / max(num_videos, 1)
+  doc_freq = len(term_freqs)
+  idf = math.log(1 + (num_videos - doc_freq + 0.5) / (doc_freq + 0.5))
+  scores = {}
+  for video_idx, tf in term_freqs.items():
+    norm = K1 * (1 - B + B * video_lengths[video_idx] / avg_length)
+    scores[video_idx] = idf * tf * (K1 + 1) / (tf + norm)
+  return scores
+
+
+"""
+Picks the limit best hits with a heap. hits are (video index, line index, ...)
+tuples in timestamp order; lectures are ordered by BM25 score and hits inside
+a lecture keep their order.
+"""
+def top_hits(hits, video_lengths, limit):
+  return [hit for score, hit in scored_hits(hits, video_lengths, limit)]
+
+"""
+Same as top_hits, returning (score, hit) pairs so hits from different
+courses can be merged.
+"""
+def scored_hits(hits, video_lengths, limit):
+  term_freqs = {}
+  for hit in hits:
+    term_freqs[hit[0]] = term_freqs.get(hit[0], 0) + 1
+  scores = bm25_scores(term_freqs, video_lengths)
+  return [(scores[hit[0]], hit) for hit in heapq.nsmallest(limit, hits, key=lambda hit: (-scores[hit[0]], hit))]
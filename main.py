@@ -1,9 +1,19 @@
-from flask import flash, Flask, render_template, request, redirect
+from flask import abort, flash, Flask, g, jsonify, render_template, request, redirect, stream_with_context, url_for
 from forms import QueryForm
 from flask_wtf.csrf import CSRFProtect
-import os, sys, houndify
-import speech_recognition as sr
-from phrase_occurrences import find_occurrences
+import json, os, sys, threading, time
+from itertools import islice
+from phrase_occurrences import find_many, iter_occurrences, iter_query, page_occurrences, page_query, page_ranked
+from compound_query import parse_query
+from catalog import Catalog
+import course_index
+from course_index import load_course
+from result_cache import ResultCache
+import metrics
+from fts_store import FtsStore
+from global_search import GlobalSearch, DEADLINE, WORKERS
+from vocabulary import SUGGESTIONS
+from http_encoding import choose_encoding, compress, compress_stream, strong_etag, MIN_COMPRESS_SIZE
 
 app = Flask(__name__)
 app.config.from_pyfile('config.py', silent=True)
@@ -11,12 +21,63 @@ csrf = CSRFProtect(app)
 
 search_string = ''
 RESULT_LIMIT = 100
+API_MAX_LIMIT = 1000
+API_MAX_TERMS = 2000
+SUGGEST_MAX_LIMIT = 20
+catalog = Catalog('examples')
+result_cache = ResultCache(app.config.get('RESULT_CACHE_SIZE', 1024), app.config.get('RESULT_CACHE_TTL', 300))
+search_store = FtsStore(app.config.get('FTS_DATABASE', 'courses.db')) if app.config.get('SEARCH_BACKEND') == 'fts' else None
+if app.config.get('COURSE_MEMORY_BUDGET_MB') is not None:
+    course_index.courses.budget = int(app.config['COURSE_MEMORY_BUDGET_MB'] * 2**20)
+pinned_paths = [course.index_path for course in catalog.courses() if course.slug in app.config.get('PINNED_COURSES', ())]
+for path in pinned_paths:
+    course_index.courses.pin(path)
+global_search = GlobalSearch(app.config.get('GLOBAL_SEARCH_WORKERS', WORKERS), app.config.get('GLOBAL_SEARCH_DEADLINE', DEADLINE))
+registry = metrics.Registry()
+request_seconds = registry.histogram('coursestamp_request_seconds', 'Time spent handling requests', ['endpoint', 'status'])
+phase_seconds = registry.histogram('coursestamp_search_phase_seconds', 'Time spent in each phase of a search', ['course', 'phase'])
+searches = registry.counter('coursestamp_searches_total', 'Searches served', ['course'])
+search_results = registry.counter('coursestamp_search_results_total', 'Results shown by searches', ['course'])
+slow_queries = registry.counter('coursestamp_slow_queries_total', 'Searches slower than SLOW_QUERY_SECONDS', ['course'])
 SECRET_KEY = 'go bears'
 app.config['SECRET_KEY'] = SECRET_KEY
-client_id = app.config['HOUNDIFY_ID']
-client_key = app.config['HOUNDIFY_KEY']
-user_id = app.config['HOUNDIFY_USR']
-client = houndify.StreamingHoundClient(client_id, client_key, user_id, sampleRate=8000)
+voice_sessions = None
+voice_lock = threading.Lock()
+
+@registry.collector
+def cache_metrics():
+    stats = result_cache.stats()
+    collected = [('coursestamp_result_cache_entries', 'Result pages in the cache', 'gauge', stats['entries'])]
+    for name in ('hits', 'misses', 'coalesced', 'evictions', 'expirations', 'invalidations'):
+        collected.append(('coursestamp_result_cache_%s_total' % name, 'Result cache ' + name, 'counter', stats[name]))
+    return collected
+
+@registry.collector
+def course_metrics():
+    stats = course_index.courses.stats()
+    slugs = {course.index_path: course.slug for course in catalog.courses()}
+    resident = [((('course', slugs.get(path, path)),), size) for path, size in course_index.courses.resident()]
+    collected = [('coursestamp_course_resident_bytes', 'Estimated memory held by each loaded course', 'gauge', resident)]
+    if stats['budget'] is not None:
+        collected.append(('coursestamp_course_memory_budget_bytes', 'Memory budget of the loaded courses', 'gauge', stats['budget']))
+    collected.append(('coursestamp_course_loads_total', 'Courses loaded', 'counter', stats['loads']))
+    collected.append(('coursestamp_course_evictions_total', 'Courses unloaded to stay within the memory budget', 'counter', stats['evictions']))
+    return collected
+
+@app.before_request
+def start_timer():
+    g.timer = metrics.Timer()
+    if app.config.get('PROFILING_ENABLED') and request.args.get('profile') == '1':
+        g.profiler = metrics.SamplingProfiler().start()
+
+@app.after_request
+def record_request(response):
+    request_seconds.observe(g.timer.elapsed(), endpoint=request.endpoint or 'none', status=response.status_code)
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.stop()
+        response = app.response_class(profiler.collapsed(), mimetype='text/plain')
+    return response
 
 @app.route('/', methods=('GET', 'POST'))
 def home():
@@ -24,64 +85,377 @@ def home():
     if request.method == 'POST':
         prof_name = request.form['profs']
         return redirect('/'+prof_name)
-    opt_list = [x[0] for x in os.walk('examples')]
-    opt_list = [i.replace('examples\\', '') for i in opt_list if 'raw_subtitles' not in i]
-    opt_list = [i.replace('examples/', '') for i in opt_list if 'raw_subtitles' not in i]
-    opt_list = [(i.replace('_', ' ').title(), i) for i in opt_list][1:]
-    opt_list = [(open("examples/"+i[1]+"/"+i[1]+".txt", "r").read()+" - "+i[0], i[1]) for i in opt_list]
+    opt_list = [(course.course_title+" - "+course.display_name, course.slug) for course in catalog.courses()]
     return render_template('index.html', form=select, option_list=opt_list, dropdown = True, search_menu = False)
 
 @app.route('/<prof_name>', methods=('GET', 'POST'))
 def pick_prof(prof_name):
     search = QueryForm(request.form)
     if request.method == 'POST':
-        if request.form['search'] == "voice":
-            search_string = listen()
-        else:
-            search_string = request.form['query']
-        if search_string != "":
-            search_string = '/' + search_string
-        return redirect('/'+prof_name+search_string)
-    f = open("examples/"+prof_name+"/"+prof_name+".txt", "r")
-    prof_name = prof_name.replace("_", " ").title()
-    course_name = f.read()
-    return render_template('index.html', form=search, dropdown = False, search_menu = True, course_name=course_name, prof_name=prof_name)
-
-@app.route('/<prof_name>/<search_term>', methods=('GET', 'POST'))
+        return redirect(search_url(prof_name, request.form['query']))
+    course = catalog.get(prof_name) or abort(404)
+    return render_template('index.html', form=search, dropdown = False, search_menu = True, course_name=course.course_title, prof_name=course.display_name,
+        voice_url=url_for('start_voice', prof_name=course.slug), suggest_url=url_for('api_suggest', prof_name=course.slug))
+
+# path: so that operators like NEAR/30 keep their slash
+@app.route('/<prof_name>/<path:search_term>', methods=('GET', 'POST'))
 def results(prof_name, search_term):
-    titles, urls, raw_phrases, term_idxes = find_occurrences(search_term, "examples/"+prof_name+"/"+prof_name+".json")
-    leftContexts = []
-    rightContexts = []
-    titleContexts = []
-    for idx, phrase in enumerate(raw_phrases):
-        leftContexts.append(phrase[:term_idxes[idx]])
-        rightContexts.append(phrase[term_idxes[idx]+len(search_term):])
-        titleContexts.append(titles[idx])
     search = QueryForm(request.form)
     if request.method == 'POST':
-        if request.form['search'] == "voice":
-            search_string = listen()
+        return redirect(search_url(prof_name, request.form['query']))
+    course = catalog.get(prof_name) or abort(404)
+    fuzzy = request.args.get("fuzzy") == "1"
+    page = request.args.get("page", 0, type=int)
+    after = request.args.get("after", -1, type=int)
+    if page < 0 or after < -1:
+        abort(400)
+    ranked = request.args.get("sort") == "relevance"
+    timer = g.timer
+    with timer.phase('load'):
+        source, version = open_course(course)
+    with timer.phase('search'):
+        occurrences, next_page = search_page(course, source, search_term, version, RESULT_LIMIT, page, after, fuzzy, ranked)
+    with timer.phase('context'):
+        urls = []
+        leftContexts = []
+        matchContexts = []
+        rightContexts = []
+        titleContexts = []
+        for occurrence in occurrences:
+            urls.append(occurrence.url)
+            leftContexts.append(occurrence.context[:occurrence.term_idx])
+            matchContexts.append(occurrence.context[occurrence.term_idx:occurrence.term_idx+occurrence.length])
+            rightContexts.append(occurrence.context[occurrence.term_idx+occurrence.length:])
+            titleContexts.append(occurrence.title)
+        next_url = None
+        if next_page is not None and ranked:
+            next_url = url_for('results', prof_name=prof_name, search_term=search_term, page=next_page, sort='relevance', fuzzy=1 if fuzzy else None)
+        elif next_page is not None:
+            next_url = url_for('results', prof_name=prof_name, search_term=search_term, after=next_page, fuzzy=1 if fuzzy else None)
+        sort_url = url_for('results', prof_name=prof_name, search_term=search_term, sort=None if ranked else 'relevance', fuzzy=1 if fuzzy else None)
+    with timer.phase('render'):
+        page_html = render_template('index.html', form=search, 
+            name=search_term, urls=urls, leftContexts=leftContexts, matchContexts=matchContexts,
+            rightContexts=rightContexts, titleContexts=titleContexts, showViewer=len(urls)>0, dropdown = False, search_menu = True, course_name=course.course_title, prof_name=course.display_name,
+            next_url=next_url, sort_url=sort_url, ranked=ranked, voice_url=url_for('start_voice', prof_name=course.slug), suggest_url=url_for('api_suggest', prof_name=course.slug))
+    record_search(course.slug, search_term, timer, len(occurrences))
+    return page_html
+
+@app.route('/api/<prof_name>/search')
+def api_search(prof_name):
+    course = catalog.get(prof_name) or abort(404)
+    query = request.args.get('q', '')
+    limit = request.args.get('limit', RESULT_LIMIT, type=int)
+    page = request.args.get('page', 0, type=int)
+    after = request.args.get('after', -1, type=int)
+    if not query or not 0 < limit <= API_MAX_LIMIT or page < 0 or after < -1:
+        abort(400)
+    fuzzy = request.args.get('fuzzy') == '1'
+    ndjson = request.args.get('format') == 'ndjson'
+    ranked = request.args.get('sort') == 'relevance'
+    encoding = choose_encoding(request.headers.get('Accept-Encoding'))
+    timer = g.timer
+    with timer.phase('load'):
+        source, version = open_course(course)
+    etag = strong_etag(version, course.slug, query, limit, page, after, fuzzy, ndjson, ranked, encoding)
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    elif ndjson and not ranked:
+        compound = parse_query(query)
+        if compound is not None:
+            hits = islice(iter_query(compound, source, fuzzy, after), page * limit, (page + 1) * limit)
         else:
-            search_string = request.form['query']
-        if search_string != "":
-            search_string = '/' + search_string
-        return redirect('/'+prof_name+search_string)
-    f = open("examples/"+prof_name+"/"+prof_name+".txt", "r")
-    prof_name = prof_name.replace("_", " ").title()
-    course_name = f.read()
-    return render_template('index.html', form=search, 
-        name=search_term, urls=urls[:RESULT_LIMIT], leftContexts=leftContexts,
-        rightContexts=rightContexts, titleContexts=titleContexts, showViewer=len(urls)>0, dropdown = False, search_menu = True, course_name=course_name, prof_name=prof_name)
-  
-def listen():
+            hits = islice(iter_occurrences(query, source, fuzzy, after), page * limit, (page + 1) * limit)
+        lines = stream_search(course.slug, query, hits, timer)
+        response = app.response_class(compress_stream(lines, encoding), mimetype='application/x-ndjson')
+    else:
+        with timer.phase('search'):
+            occurrences, next_page = search_page(course, source, query, version, limit, page, after, fuzzy, ranked)
+        with timer.phase('render'):
+            if ndjson:
+                body = b''.join(json.dumps(occurrence._asdict(), separators=(',', ':')).encode('utf-8') + b'\n' for occurrence in occurrences)
+            else:
+                body = json.dumps({'course': course.slug, 'query': query, 'results': [occurrence._asdict() for occurrence in occurrences],
+                    'next': next_page}, separators=(',', ':')).encode('utf-8')
+            if len(body) < MIN_COMPRESS_SIZE:
+                encoding = None
+            body = compress(body, encoding)
+        response = app.response_class(body, mimetype='application/x-ndjson' if ndjson else 'application/json')
+        record_search(course.slug, query, timer, len(occurrences))
+    if encoding and response.status_code == 200:
+        response.headers['Content-Encoding'] = encoding
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'public, max-age=%d' % app.config.get('API_MAX_AGE', 300)
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
+@app.route('/api/<prof_name>/batch', methods=('GET', 'POST'))
+@csrf.exempt
+def api_batch(prof_name):
+    course = catalog.get(prof_name) or abort(404)
+    if request.method == 'POST':
+        body = request.get_json(silent=True)
+        if not isinstance(body, dict):
+            abort(400)
+        terms = body.get('terms', [])
+        limit = body.get('limit', RESULT_LIMIT)
+    else:
+        terms = request.args.getlist('q')
+        limit = request.args.get('limit', RESULT_LIMIT, type=int)
+    if not isinstance(terms, list) or not all(isinstance(term, str) and term for term in terms):
+        abort(400)
+    if not 0 < len(terms) <= API_MAX_TERMS or type(limit) is not int or not 0 < limit <= API_MAX_LIMIT:
+        abort(400)
+    encoding = choose_encoding(request.headers.get('Accept-Encoding'))
+    timer = g.timer
+    with timer.phase('load'):
+        source, version = open_course(course)
+    with timer.phase('search'):
+        found = find_many(terms, source, limit)
+    with timer.phase('render'):
+        results = {}
+        for term, (count, (titles, urls, contexts, term_idxes)) in found.items():
+            results[term] = {'count': count, 'results': [{'title': title, 'url': url, 'context': context, 'term_idx': term_idx}
+                for title, url, context, term_idx in zip(titles, urls, contexts, term_idxes)]}
+        body = json.dumps({'course': course.slug, 'terms': results}, separators=(',', ':')).encode('utf-8')
+        if len(body) < MIN_COMPRESS_SIZE:
+            encoding = None
+        body = compress(body, encoding)
+    response = app.response_class(body, mimetype='application/json')
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    record_search(course.slug, '%d terms' % len(found), timer, sum(count for count, _ in found.values()))
+    return response
+
+@app.route('/api/<prof_name>/suggest')
+def api_suggest(prof_name):
+    course = catalog.get(prof_name) or abort(404)
+    query = request.args.get('q', '')
+    limit = request.args.get('limit', SUGGESTIONS, type=int)
+    if not 0 < limit <= SUGGEST_MAX_LIMIT:
+        abort(400)
+    source, version = open_course(course)
+    vocabulary = (load_course(source) if isinstance(source, str) else source).vocabulary()
+    response = jsonify({'query': query, 'suggestions': [{'text': text, 'count': count} for text, count in vocabulary.suggest(query, limit)]})
+    response.headers['Cache-Control'] = 'public, max-age=%d' % app.config.get('API_MAX_AGE', 300)
+    return response
+
+@app.route('/search/<path:search_term>', methods=('GET', 'POST'))
+def search_all(search_term):
     search = QueryForm(request.form)
-    rec = sr.Recognizer()
-    with sr.Microphone() as source:
-        rec.adjust_for_ambient_noise(source)
-        app.logger.info("I'm listening...")
-        audio = rec.listen(source, phrase_time_limit=3)
-    search_string = rec.recognize_houndify(audio, client_id, client_key)
-    return search_string
+    if request.method == 'POST':
+        return redirect(url_for('search_all', search_term=request.form['query'])) if request.form['query'] else redirect('/')
+    fuzzy = request.args.get("fuzzy") == "1"
+    timer = g.timer
+    with timer.phase('search'):
+        hits, skipped = global_search.search(search_term, [(course.slug, search_source(course)) for course in catalog.courses()], RESULT_LIMIT, fuzzy)
+    with timer.phase('context'):
+        urls = []
+        leftContexts = []
+        matchContexts = []
+        rightContexts = []
+        titleContexts = []
+        for hit in hits:
+            occurrence = hit.occurrence
+            course = catalog.get(hit.course)
+            urls.append(occurrence.url)
+            leftContexts.append(occurrence.context[:occurrence.term_idx])
+            matchContexts.append(occurrence.context[occurrence.term_idx:occurrence.term_idx+occurrence.length])
+            rightContexts.append(occurrence.context[occurrence.term_idx+occurrence.length:])
+            titleContexts.append((course.display_name if course else hit.course) + ': ' + occurrence.title)
+    with timer.phase('render'):
+        page_html = render_template('index.html', form=search,
+            name=search_term, urls=urls, leftContexts=leftContexts, matchContexts=matchContexts,
+            rightContexts=rightContexts, titleContexts=titleContexts, showViewer=len(urls)>0, dropdown = False, search_menu = True, course_name='All courses', prof_name=None,
+            next_url=None, voice_url=None, skipped=skipped)
+    record_search('all', search_term, timer, len(hits))
+    return page_html
+
+@app.route('/api/search')
+def api_search_all():
+    query = request.args.get('q', '')
+    limit = request.args.get('limit', RESULT_LIMIT, type=int)
+    if not query or not 0 < limit <= API_MAX_LIMIT:
+        abort(400)
+    fuzzy = request.args.get('fuzzy') == '1'
+    timer = g.timer
+    with timer.phase('search'):
+        hits, skipped = global_search.search(query, [(course.slug, search_source(course)) for course in catalog.courses()], limit, fuzzy)
+    record_search('all', query, timer, len(hits))
+    return jsonify({'query': query, 'results': [dict(hit.occurrence._asdict(), course=hit.course, score=hit.score) for hit in hits],
+        'skipped': skipped})
+
+def search_url(prof_name, search_term):
+    """
+    Where the search box of a course page sends a search, or the course page
+    itself for an empty one
+    """
+    if not search_term:
+        return url_for('pick_prof', prof_name=prof_name)
+    return url_for('results', prof_name=prof_name, search_term=search_term)
+
+def search_source(course):
+    """
+    What to search for a catalog course: the stored copy when the fts backend
+    has the course, otherwise its json, loaded through course_index by the search
+    """
+    if search_store is not None:
+        stored = search_store.course(course.slug)
+        if stored is not None:
+            return stored
+    return course.index_path
+
+def open_course(course):
+    """
+    search_source for a catalog course and its version
+    """
+    source = search_source(course)
+    if isinstance(source, str):
+        return source, load_course(source).version
+    return source, source.version
+
+def search_page(course, source, search_term, version, limit, page=0, after=-1, fuzzy=False, ranked=False):
+    """
+    One page of results and what fetches the next one (None after the last):
+    the after cursor in course order, or with ranked, where lectures are
+    ordered by relevance, the next page number
+    """
+    query = parse_query(search_term)
+    # operators are case sensitive, so searches with them are cached as typed
+    key = (course.slug, search_term if query is not None else search_term.lower(), limit, page, after, fuzzy, ranked)
+    if ranked:
+        def search():
+            occurrences, more = page_ranked(query if query is not None else search_term, source, limit, page, fuzzy)
+            return occurrences, page + 1 if more else None
+    elif query is not None:
+        search = lambda: page_query(query, source, limit, page=page, after=after, fuzzy=fuzzy)
+    else:
+        search = lambda: page_occurrences(search_term, source, limit, page=page, after=after, fuzzy=fuzzy)
+    return result_cache.get(key, version, search)
+
+"""
+Yields the ndjson lines of a streamed search as its hits are found. The time
+spent finding and encoding them, not the time the client takes to read them,
+is recorded like any other search once the last line has been sent.
+"""
+def stream_search(slug, query, hits, timer):
+    searched = rendered = 0.0
+    count = 0
+    while True:
+        start = time.perf_counter()
+        occurrence = next(hits, None)
+        searched += time.perf_counter() - start
+        if occurrence is None:
+            break
+        start = time.perf_counter()
+        line = json.dumps(occurrence._asdict(), separators=(',', ':')).encode('utf-8') + b'\n'
+        rendered += time.perf_counter() - start
+        count += 1
+        yield line
+    timer.add('search', searched)
+    timer.add('render', rendered)
+    record_search(slug, query, timer, count)
+
+def record_search(slug, search_term, timer, result_count):
+    for phase, seconds in timer.phases:
+        phase_seconds.observe(seconds, course=slug, phase=phase)
+    searches.inc(course=slug)
+    search_results.inc(result_count, course=slug)
+    slow = app.config.get('SLOW_QUERY_SECONDS')
+    if slow is not None and timer.elapsed() >= slow:
+        slow_queries.inc(course=slug)
+        app.logger.warning('slow query %s %r: %d results in %.1fms (%s)', slug, search_term, result_count, timer.elapsed() * 1000, timer.describe())
+  
+@app.route('/cache-stats')
+def cache_stats():
+    return jsonify(result_cache.stats())
+
+@app.route('/course-stats')
+def course_stats():
+    slugs = {course.index_path: course.slug for course in catalog.courses()}
+    return jsonify(dict(course_index.courses.stats(),
+        resident={slugs.get(path, path): size for path, size in course_index.courses.resident()}))
+
+@app.route('/metrics')
+def metrics_page():
+    return app.response_class(registry.render(), mimetype='text/plain; version=0.0.4')
+
+def warm_up():
+    """
+    Loads every course of the catalog with its trigram index and vocabulary,
+    so the first searches do not pay for them. wsgi.py calls this before the
+    worker takes requests. Courses served by the fts backend need no warm-up,
+    and loading stops once the memory budget starts unloading courses.
+    """
+    if search_store is not None:
+        return
+    evictions = course_index.courses.evictions
+    for course in catalog.courses():
+        loaded = load_course(course.index_path)
+        loaded.trigram_index()
+        loaded.vocabulary()
+        if course_index.courses.evictions > evictions:
+            break
+
+def get_voice_sessions():
+    """
+    The voice sessions of this worker. The voice stack is imported, and the
+    Houndify credentials read, on the first voice request, so text search
+    starts without them.
+    """
+    global voice_sessions
+    with voice_lock:
+        if voice_sessions is None:
+            if 'HOUNDIFY_ID' not in app.config:
+                abort(503)
+            import houndify
+            from voice_search import VoiceSessions, MAX_SESSIONS, SAMPLE_RATE
+            client_id = app.config['HOUNDIFY_ID']
+            client_key = app.config['HOUNDIFY_KEY']
+            user_id = app.config['HOUNDIFY_USR']
+            voice_sessions = VoiceSessions(lambda: houndify.StreamingHoundClient(client_id, client_key, user_id, sampleRate=SAMPLE_RATE),
+                max_sessions=app.config.get('VOICE_MAX_SESSIONS', MAX_SESSIONS))
+    return voice_sessions
+
+@app.route('/voice/<prof_name>', methods=('POST',))
+def start_voice(prof_name):
+    from voice_search import SAMPLE_RATE
+    course = catalog.get(prof_name) or abort(404)
+    session = get_voice_sessions().create(course.slug) or abort(503)
+    return jsonify(id=session.id, sampleRate=SAMPLE_RATE,
+        audio=url_for('voice_audio', session_id=session.id),
+        finish=url_for('finish_voice', session_id=session.id),
+        events=url_for('voice_events', session_id=session.id))
+
+@app.route('/voice/session/<session_id>/audio', methods=('POST',))
+def voice_audio(session_id):
+    session = get_voice_sessions().get(session_id) or abort(404)
+    if not session.add_audio(request.get_data()):
+        abort(413)
+    return '', 204
+
+@app.route('/voice/session/<session_id>/finish', methods=('POST',))
+def finish_voice(session_id):
+    session = get_voice_sessions().get(session_id) or abort(404)
+    session.end_audio()
+    return '', 204
+
+@app.route('/voice/session/<session_id>/events')
+def voice_events(session_id):
+    session = get_voice_sessions().get(session_id) or abort(404)
+    def search_url(transcript):
+        if not transcript:
+            return url_for('pick_prof', prof_name=session.data)
+        return url_for('results', prof_name=session.data, search_term=transcript)
+    from voice_search import event_stream
+    def stream():
+        try:
+            for event in event_stream(session.events(), search_url):
+                yield event
+        finally:
+            voice_sessions.discard(session_id)
+    return app.response_class(stream_with_context(stream()), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 if __name__ == "__main__":
     app.run(debug=True)
\ No newline at end of file
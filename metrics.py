@@ -0,0 +1,210 @@
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# upper bounds in seconds of the latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# seconds between stack samples; the interpreter's switch interval (5ms) is the practical minimum
+SAMPLE_INTERVAL = 0.005
+
+"""
+Counters and latency histograms of one worker, rendered in the Prometheus text
+format for /metrics, plus a per-request phase timer and a sampling profiler.
+
+Only the standard library is used; metrics are kept per process, so with
+several gunicorn workers every scrape sees the worker that served it.
+"""
+class Registry(object):
+
+  def __init__(self):
+    self._metrics = []
+    self._collectors = []
+
+  def counter(self, name, help, labels=()):
+    return self._add(Counter(name, help, labels))
+
+  def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+    return self._add(Histogram(name, help, labels, buckets))
+
+  def collector(self, collect):
+    """
+    Registers collect(), called on every render, which returns
+    (name, help, type, value) tuples for values kept elsewhere. value may
+    also be a list of (labels, value) samples, labels being (label, text)
+    pairs.
+    """
+    self._collectors.append(collect)
+    return collect
+
+  def _add(self, metric):
+    self._metrics.append(metric)
+    return metric
+
+  def render(self):
+    lines = []
+    for metric in self._metrics:
+      lines.append("# HELP %s %s" % (metric.name, metric.help))
+      lines.append("# TYPE %s %s" % (metric.name, metric.type))
+      for name, labels, value in metric.samples():
+        lines.append(_sample(name, labels, value))
+    for collect in self._collectors:
+      for name, help, type, value in collect():
+        lines.append("# HELP %s %s" % (name, help))
+        lines.append("# TYPE %s %s" % (name, type))
+        for labels, sample in (value if isinstance(value, list) else [((), value)]):
+          lines.append(_sample(name, labels, sample))
+    return "\n".join(lines) + "\n"
+
+
+class Counter(object):
+  type = "counter"
+
+  def __init__(self, name, help, labels=()):
+    self.name = name
+    self.help = help
+    self.labels = tuple(labels)
+    self._values = {}
+    self._lock = threading.Lock()
+
+  def inc(self, amount=1, **labels):
+    key = _key(self.labels, labels)
+    with self._lock:
+      self._values[key] = self._values.get(key, 0) + amount
+
+  def samples(self):
+    with self._lock:
+      values = sorted(self._values.items())
+    return [(self.name, tuple(zip(self.labels, key)), value) for key, value in values]
+
+
+class Histogram(object):
+  type = "histogram"
+
+  def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+    self.name = name
+    self.help = help
+    self.labels = tuple(labels)
+    self.buckets = tuple(sorted(buckets))
+    self._values = {}
+    self._lock = threading.Lock()
+
+  def observe(self, value, **labels):
+    key = _key(self.labels, labels)
+    with self._lock:
+      counts = self._values.get(key)
+      if counts is None:
+        # one count per bucket, one for +Inf, then the sum
+        counts = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+      counts[bisect_left(self.buckets, value)] += 1
+      counts[-1] += value
+
+  def samples(self):
+    with self._lock:
+      values = sorted((key, list(counts)) for key, counts in self._values.items())
+    samples = []
+    for key, counts in values:
+      labels = tuple(zip(self.labels, key))
+      total = 0
+      for bound, count in zip(self.buckets + ("+Inf",), counts):
+        total += count
+        samples.append((self.name + "_bucket", labels + (("le", _number(bound)),), total))
+      samples.append((self.name + "_sum", labels, counts[-1]))
+      samples.append((self.name + "_count", labels, total))
+    return samples
+
+
+"""
+Times the phases of one request, e.g.
+
+  with timer.phase("search"):
+    ...
+"""
+class Timer(object):
+
+  def __init__(self):
+    self.start = time.perf_counter()
+    self.phases = []
+
+  @contextmanager
+  def phase(self, name):
+    start = time.perf_counter()
+    try:
+      yield
+    finally:
+      self.phases.append((name, time.perf_counter() - start))
+
+  def add(self, name, seconds):
+    """
+    Records a phase timed by the caller, e.g. one spread over the chunks of a
+    streamed response
+    """
+    self.phases.append((name, seconds))
+
+  def elapsed(self):
+    return time.perf_counter() - self.start
+
+  def describe(self):
+    return " ".join("%s=%.1fms" % (name, seconds * 1000) for name, seconds in self.phases)
+
+
+"""
+Samples the stack of one thread every interval seconds from a background
+thread until stopped. collapsed() returns the samples in the collapsed stack
+format ("outer;inner;innermost count" per line) read by flamegraph.pl and
+speedscope.
+"""
+class SamplingProfiler(object):
+
+  def __init__(self, thread_id=None, interval=SAMPLE_INTERVAL):
+    self.thread_id = thread_id or threading.get_ident()
+    self.interval = interval
+    self.stacks = {}
+    self.samples = 0
+    self._stop = threading.Event()
+    self._thread = threading.Thread(target=self._run, daemon=True)
+
+  def start(self):
+    self._thread.start()
+    return self
+
+  def stop(self):
+    self._stop.set()
+    self._thread.join()
+    return self
+
+  def _run(self):
+    while not self._stop.wait(self.interval):
+      frame = sys._current_frames().get(self.thread_id)
+      stack = []
+      while frame is not None:
+        code = frame.f_code
+        stack.append("%s:%s" % (os.path.basename(code.co_filename), code.co_name))
+        frame = frame.f_back
+      if stack:
+        stack = ";".join(reversed(stack))
+        self.stacks[stack] = self.stacks.get(stack, 0) + 1
+        self.samples += 1
+
+  def collapsed(self):
+    ordered = sorted(self.stacks.items(), key=lambda item: (-item[1], item[0]))
+    return "".join("%s %d\n" % (stack, count) for stack, count in ordered)
+
+
+def _key(names, labels):
+  return tuple(str(labels[name]) for name in names)
+
+def _number(value):
+  if isinstance(value, str):
+    return value
+  return str(value) if isinstance(value, int) else repr(float(value))
+
+def _sample(name, labels, value):
+  if labels:
+    name += "{%s}" % ",".join('%s="%s"' % (label, _escape(text)) for label, text in labels)
+  return "%s %s" % (name, _number(value))
+
+def _escape(text):
+  return text.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
@@ -1,46 +1,188 @@
 import sys
-import json
-import re
+from collections import namedtuple
+from itertools import islice
+from compound_query import run_query
+from course_index import load_course
+from inverted_index import scored_hits, top_hits
 
 youtube = "https://www.youtube.com/embed/"
-title_matcher = re.compile("Title=(.*)_Id=(.*)") # YouTube code only
+
+# one search result, matching length characters of context from term_idx;
+# cursor resumes a search right after it
+Occurrence = namedtuple("Occurrence", ["title", "url", "context", "term_idx", "length", "cursor"])
+
+"""
+The course to search: filename is a course json or course file, loaded through
+course_index, or an already loaded course such as fts_store.FtsCourse.
+"""
+def _course(filename):
+  return load_course(filename) if isinstance(filename, str) else filename
+
+"""
+Builds the result entry for a match of length characters at phraseIdx of
+line line_id: the video, the url seeking to the start of the context, or to
+the matched word when the course has word timings, the fixed-width context
+around the match and where the match starts in it.
+"""
+def _occurrence(course, line_id, phraseIdx, length):
+  trigram_index = course.trigram_index()
+  video_idx, index = trigram_index.locate(line_id)
+  video = course.videos[video_idx]
+  context, term_idx, first = trigram_index.snippet(line_id, phraseIdx, length)
+  start = video.timestamps[first - course.video_starts[video_idx]]
+  if video.words is not None:
+    word_start = video.words.seek(video.timestamps[index], video.lowered[index], phraseIdx)
+    if word_start is not None:
+      start = word_start // 1000
+  url = youtube + video.youtube_id + "?start=" + str(start)
+  return video, url, context, term_idx
 
 """
 Searches the given formatted json file for key phrases
 and out puts the youtube timestamped link.
 
-Returns previous phrase to allow for prepadding and post padding of phrase.
+Returns the text around each match to allow for prepadding and post padding
+of phrase. The course is loaded through course_index, so repeated searches
+reuse the parsed file instead of reading it again. Only videos holding every
+trigram of the phrase are scanned, and phrases split over two subtitle lines
+are found too. With fuzzy, text within one edit of the phrase (common in
+auto-generated captions) also matches.
+"""
+def find_occurrences(phrase, filename, fuzzy=False):
+  course = _course(filename)
+  hits = course.trigram_index().find(phrase.lower(), fuzzy)
+  return _results(course, hits)
+
 """
-def find_occurrences(phrase, filename):
+Lazily yields the same results as find_occurrences, one Occurrence at a time
+in course order, so callers that stop early never pay for later matches.
+after is the cursor of the last result already seen.
+"""
+def iter_occurrences(phrase, filename, fuzzy=False, after=-1):
+  course = _course(filename)
+  trigram_index = course.trigram_index()
+  for line_id, phraseIdx, length in trigram_index.iter_find(phrase.lower(), fuzzy, after):
+    video, url, context, term_idx = _occurrence(course, line_id, phraseIdx, length)
+    yield Occurrence(video.title, url, context, term_idx, length, line_id)
+
+"""
+Returns one page of at most limit Occurrences and the cursor to pass as after
+for the next page (None on the last page). Pages start after the given cursor;
+page skips that many whole pages first, without building their context.
+"""
+def page_occurrences(phrase, filename, limit, page=0, after=-1, fuzzy=False):
+  course = _course(filename)
+  trigram_index = course.trigram_index()
+  hits = islice(trigram_index.iter_find(phrase.lower(), fuzzy, after), page * limit, None)
+  occurrences = []
+  for line_id, phraseIdx, length in hits:
+    if len(occurrences) == limit:
+      return occurrences, occurrences[-1].cursor
+    video, url, context, term_idx = _occurrence(course, line_id, phraseIdx, length)
+    occurrences.append(Occurrence(video.title, url, context, term_idx, length, line_id))
+  return occurrences, None
+
+"""
+Same as iter_occurrences for a search with operators (see compound_query.py):
+the matches of its first term that pass the lecture and time filters and have
+every NEAR term close enough. The query is answered in full up front; only
+the context of each result is built as it is consumed.
+"""
+def iter_query(query, filename, fuzzy=False, after=-1):
+  course = _course(filename)
+  for line_id, phraseIdx, length in _query_hits(query, course, fuzzy, after):
+    video, url, context, term_idx = _occurrence(course, line_id, phraseIdx, length)
+    yield Occurrence(video.title, url, context, term_idx, length, line_id)
+
+"""
+Same as page_occurrences for a search with operators
+"""
+def page_query(query, filename, limit, page=0, after=-1, fuzzy=False):
+  course = _course(filename)
+  hits = _query_hits(query, course, fuzzy, after)[page * limit:(page + 1) * limit + 1]
+  occurrences = []
+  for line_id, phraseIdx, length in hits[:limit]:
+    video, url, context, term_idx = _occurrence(course, line_id, phraseIdx, length)
+    occurrences.append(Occurrence(video.title, url, context, term_idx, length, line_id))
+  return occurrences, occurrences[-1].cursor if len(hits) > limit else None
+
+def _query_hits(query, course, fuzzy, after):
+  hits = []
+  for video_idx, index, phraseIdx, length in run_query(query, course, fuzzy):
+    line_id = course.video_starts[video_idx] + index
+    if line_id > after:
+      hits.append((line_id, phraseIdx, length))
+  return hits
+
+"""
+Same results as find_occurrences, but only the best limit hits, with lectures
+ranked by BM25. Context is only assembled for the hits that are returned.
+"""
+def ranked_occurrences(phrase, filename, limit, fuzzy=False):
+  course = _course(filename)
+  hits = course.trigram_index().search(phrase.lower(), limit, fuzzy)
+  return _results(course, hits)
+
+"""
+One page of the results of ranked_occurrences as Occurrences: the limit best
+hits after the first page * limit of them, and whether more follow. phrase
+may also be a search with operators (a compound_query.Query), whose matches
+are ranked the same way.
+"""
+def page_ranked(phrase, filename, limit, page=0, fuzzy=False):
+  course = _course(filename)
+  trigram_index = course.trigram_index()
+  if isinstance(phrase, str):
+    hits = trigram_index.search(phrase.lower(), (page + 1) * limit + 1, fuzzy)
+  else:
+    hits = top_hits(run_query(phrase, course, fuzzy), trigram_index.video_lengths, (page + 1) * limit + 1)
+  occurrences = []
+  for video_idx, index, phraseIdx, length in hits[page * limit:(page + 1) * limit]:
+    line_id = course.video_starts[video_idx] + index
+    video, url, context, term_idx = _occurrence(course, line_id, phraseIdx, length)
+    occurrences.append(Occurrence(video.title, url, context, term_idx, length, line_id))
+  return occurrences, len(hits) > (page + 1) * limit
+
+"""
+The limit best substring matches as (BM25 score, Occurrence) pairs, best
+first. Scores of different courses are comparable enough to merge results
+across courses (see global_search.py).
+"""
+def scored_occurrences(phrase, filename, limit, fuzzy=False):
+  course = _course(filename)
+  trigram_index = course.trigram_index()
+  scored = []
+  for score, (video_idx, index, phraseIdx, length) in scored_hits(trigram_index.find(phrase.lower(), fuzzy), trigram_index.video_lengths, limit):
+    line_id = course.video_starts[video_idx] + index
+    video, url, context, term_idx = _occurrence(course, line_id, phraseIdx, length)
+    scored.append((score, Occurrence(video.title, url, context, term_idx, length, line_id)))
+  return scored
+
+"""
+Searches many phrases at once, for study guides and glossaries. Returns a
+dict of each phrase -> (number of matches, results), where results are the
+(titles, urls, contexts, term indexes) find_occurrences returns for it, cut
+to the first limit matches when limit is given. Large sets of phrases are
+matched in a single pass over the course (see TrigramIndex.find_many), and
+the automaton for a set is reused by later searches for the same phrases.
+"""
+def find_many(phrases, filename, limit=None):
+  course = _course(filename)
+  phrases = list(dict.fromkeys(phrases))
+  found = course.trigram_index().find_many([phrase.lower() for phrase in phrases])
+  return {phrase: (len(hits), _results(course, hits[:limit])) for phrase, hits in zip(phrases, found)}
+
+def _results(course, hits):
   titles = []
   urls = []
   phrases = []
   term_idxes = []
-  with open(filename) as file:
-    data = json.load(file)
-    for video_title in data:
-      title_obj = title_matcher.match(video_title)
-      title, youtube_id = title_obj.group(1), title_obj.group(2)
-      video_data = data[video_title]
-      timestamps = list(video_data.keys())
-      for index in range(len(timestamps)):
-          if phrase.lower() in video_data[timestamps[index]].lower():
-            timestamp = timestamps[index] if index == 0 else timestamps[index - 1]
-            titles.append(title)
-            urls.append(youtube + youtube_id + "?start=" + timestamp)
-            context = ""
-            phraseIdx = video_data[timestamps[index]].lower().find(phrase.lower())
-            if(index==0):
-              term_idxes.append(phraseIdx)
-              context+=video_data[timestamps[index]]
-              context+=video_data[timestamps[index+1]]
-            else:
-              term_idxes.append(len(video_data[timestamps[index-1]])+phraseIdx)
-              context+=video_data[timestamps[index-1]]
-              context+=video_data[timestamps[index]]
-              if(index!=len(timestamps)-1):
-                context+=video_data[timestamps[index+1]]
-            phrases.append(context)
+  for video_idx, index, phraseIdx, length in hits:
+    video, url, context, term_idx = _occurrence(course, course.video_starts[video_idx] + index, phraseIdx, length)
+    titles.append(video.title)
+    urls.append(url)
+    phrases.append(context)
+    term_idxes.append(term_idx)
   return titles, urls, phrases, term_idxes
 
 if __name__ == '__main__':
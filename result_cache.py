@@ -0,0 +1,119 @@
+import threading
+import time
+from collections import OrderedDict
+
+"""
+A bounded cache of search results shared by the requests of one worker.
+
+Entries are evicted least recently used once there are more than max_entries,
+and expire ttl seconds after they were computed. Every entry remembers the
+version of the course index it was computed from and is dropped when the
+course has been rebuilt since. Concurrent requests for a key that is being
+computed wait for that computation instead of repeating it.
+"""
+class ResultCache(object):
+
+  def __init__(self, max_entries=1024, ttl=300):
+    self.max_entries = max_entries
+    self.ttl = ttl
+    self._entries = OrderedDict()
+    self._inflight = {}
+    self._lock = threading.Lock()
+    self.hits = 0
+    self.misses = 0
+    self.coalesced = 0
+    self.evictions = 0
+    self.expirations = 0
+    self.invalidations = 0
+
+  def get(self, key, version, compute):
+    """
+    Returns the cached result for key if it was computed from this version of
+    the course, otherwise calls compute() once and caches what it returns.
+    """
+    with self._lock:
+      entry = self._entries.get(key)
+      if entry is not None:
+        entry_version, created, result = entry
+        if entry_version != version:
+          del self._entries[key]
+          self.invalidations += 1
+        elif time.monotonic() - created > self.ttl:
+          del self._entries[key]
+          self.expirations += 1
+        else:
+          self._entries.move_to_end(key)
+          self.hits += 1
+          return result
+      flight = self._inflight.get((key, version))
+      if flight is None:
+        flight = self._inflight[(key, version)] = _Flight()
+        leader = True
+        self.misses += 1
+      else:
+        leader = False
+        self.coalesced += 1
+
+    if not leader:
+      return flight.wait()
+    try:
+      result = compute()
+    except BaseException as error:
+      with self._lock:
+        del self._inflight[(key, version)]
+      flight.fail(error)
+      raise
+    with self._lock:
+      del self._inflight[(key, version)]
+      self._entries[key] = (version, time.monotonic(), result)
+      self._entries.move_to_end(key)
+      while len(self._entries) > self.max_entries:
+        self._entries.popitem(last=False)
+        self.evictions += 1
+    flight.done(result)
+    return result
+
+  def invalidate(self, match=None):
+    """
+    Drops every entry, or only those whose key satisfies match(key)
+    """
+    with self._lock:
+      for key in [key for key in self._entries if match is None or match(key)]:
+        del self._entries[key]
+        self.invalidations += 1
+
+  def stats(self):
+    with self._lock:
+      return {
+        "entries": len(self._entries),
+        "max_entries": self.max_entries,
+        "ttl": self.ttl,
+        "hits": self.hits,
+        "misses": self.misses,
+        "coalesced": self.coalesced,
+        "evictions": self.evictions,
+        "expirations": self.expirations,
+        "invalidations": self.invalidations
+      }
+
+
+class _Flight(object):
+
+  def __init__(self):
+    self._event = threading.Event()
+    self._result = None
+    self._error = None
+
+  def done(self, result):
+    self._result = result
+    self._event.set()
+
+  def fail(self, error):
+    self._error = error
+    self._event.set()
+
+  def wait(self):
+    self._event.wait()
+    if self._error is not None:
+      raise self._error
+    return self._result
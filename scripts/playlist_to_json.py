@@ -1,22 +1,144 @@
+import argparse
+import json
 import os
+import re
+import shutil
 import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from subtitle_parser import ParseCache
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from course_file import convert
+
+# subtitle downloads running at once
+FETCH_JOBS = 4
+# progress of an ingest, kept in the course directory
+CHECKPOINT = "ingest.json"
+
+subtitle_matcher = re.compile("Title=(.*)_Id=(.*)\\.en\\.vtt")
 
 """
 Combines playlist_to_subtitles.py and subtitle_parser.py
 to create a directory structure in examples with subtitles and json.
+
+Everything runs in this process as one pipeline: the playlist is listed,
+subtitles are fetched a few at a time, each file is parsed as soon as it
+arrives, and the course json and course file are built at the end. Progress
+is checkpointed in <course>/ingest.json after every video, so running the same
+command again after an interruption carries on where it stopped.
+"""
+def json_generator(link, name="new", examples=None, title=None, jobs=FETCH_JOBS):
+  import playlist_to_subtitles
+  return ingest(name, playlist_to_subtitles.playlist_entries, _youtube_fetcher(playlist_to_subtitles), link,
+    examples=examples, title=title, jobs=jobs)
+
 """
-def json_generator(link):
-  os.mkdir("../examples/new")
-  os.mkdir("../examples/new/raw_subtitles/")
-  os.system("cp playlist_to_subtitles.py ../examples/new/raw_subtitles/playlist_to_subtitles.py")
-  os.chdir("../examples/new/raw_subtitles/")
-  os.system("python playlist_to_subtitles.py " + link)
-  os.system("rm playlist_to_subtitles.py")
-  os.system("cp ../../../scripts/subtitle_parser.py subtitle_parser.py")
-  os.system("python subtitle_parser.py > ../new.json")
-  os.system("rm subtitle_parser.py")
+Same pipeline over .vtt files already on disk, such as examples/*/raw_subtitles,
+so an ingest can be run and tested offline.
+"""
+def local_generator(source_dir, name, examples=None, title=None, jobs=FETCH_JOBS):
+  return ingest(name, _local_entries, _local_fetcher(source_dir), source_dir,
+    examples=examples, title=title, jobs=jobs)
+
+"""
+Runs the pipeline for the course examples/<name>. list_entries(source) returns
+the videos as dicts with an id and title; fetch(entry, directory) puts the
+subtitles of one video into directory. Returns the path of the course json.
+"""
+def ingest(name, list_entries, fetch, source, examples=None, title=None, jobs=FETCH_JOBS):
+  examples = examples or os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "examples")
+  course_dir = os.path.join(examples, name)
+  subtitles_dir = os.path.join(course_dir, "raw_subtitles")
+  os.makedirs(subtitles_dir, exist_ok=True)
+
+  checkpoint_path = os.path.join(course_dir, CHECKPOINT)
+  checkpoint = _load_checkpoint(checkpoint_path)
+  if checkpoint.get("source") != source:
+    checkpoint = {"source": source, "entries": None, "done": {}, "failed": {}}
+  if checkpoint["entries"] is None:
+    checkpoint["entries"] = list_entries(source)
+    _save_checkpoint(checkpoint_path, checkpoint)
+
+  cache = ParseCache(subtitles_dir)
+  pending = [entry for entry in checkpoint["entries"] if entry["id"] not in checkpoint["done"]]
+  with ThreadPoolExecutor(max_workers=jobs) as pool:
+    futures = {pool.submit(_fetch, fetch, entry, subtitles_dir): entry for entry in pending}
+    for future in as_completed(futures):
+      entry = futures[future]
+      try:
+        filename = future.result()
+      except Exception as error:
+        checkpoint["failed"][entry["id"]] = str(error)
+      else:
+        if filename is not None:
+          cache.update(filename)
+        checkpoint["done"][entry["id"]] = filename
+        checkpoint["failed"].pop(entry["id"], None)
+      cache.save()
+      _save_checkpoint(checkpoint_path, checkpoint)
+
+  if checkpoint["failed"]:
+    sys.stderr.write("%d videos failed, run again to retry: %s\n" % (len(checkpoint["failed"]), ", ".join(sorted(checkpoint["failed"]))))
+  cache.refresh(jobs=1)
+  json_path = os.path.join(course_dir, name + ".json")
+  cache.write_json(json_path)
+  cache.save()
+  convert(json_path)
+  title_path = os.path.join(course_dir, name + ".txt")
+  if title is not None or not os.path.exists(title_path):
+    with open(title_path, "w") as file:
+      file.write(title or name.replace("_", " ").title())
+  return json_path
+
+"""
+Fetches one video and returns the name of its subtitle file, or None when
+the video has no English subtitles.
+"""
+def _fetch(fetch, entry, directory):
+  fetch(entry, directory)
+  suffix = "_Id=" + entry["id"] + ".en.vtt"
+  for filename in os.listdir(directory):
+    if filename.endswith(suffix):
+      return filename
+  return None
+
+def _youtube_fetcher(playlist_to_subtitles):
+  return lambda entry, directory: playlist_to_subtitles.fetch_subtitles(entry["id"], directory)
+
+def _local_entries(source_dir):
+  entries = []
+  for filename in sorted(os.listdir(source_dir)):
+    subtitle_obj = subtitle_matcher.match(filename)
+    if subtitle_obj:
+      entries.append({"id": subtitle_obj.group(2), "title": subtitle_obj.group(1), "filename": filename})
+  return entries
+
+def _local_fetcher(source_dir):
+  return lambda entry, directory: shutil.copyfile(os.path.join(source_dir, entry["filename"]), os.path.join(directory, entry["filename"]))
+
+def _load_checkpoint(path):
+  try:
+    with open(path) as file:
+      return json.load(file)
+  except (OSError, ValueError):
+    return {}
+
+def _save_checkpoint(path, checkpoint):
+  with open(path + ".tmp", "w") as file:
+    json.dump(checkpoint, file, indent = 2)
+  os.replace(path + ".tmp", path)
 
 if __name__ == '__main__':
-  args = sys.argv
-  assert len(args) == 2, "Must provide playlist"
-  json_generator(args[1])
\ No newline at end of file
+  parser = argparse.ArgumentParser(description="Builds examples/<name> from a YouTube playlist.")
+  parser.add_argument("playlist", nargs="?", help="playlist link")
+  parser.add_argument("--name", default="new", help="course directory in examples/ (default: new)")
+  parser.add_argument("--title", help="course title shown on the home page")
+  parser.add_argument("--from-dir", metavar="DIR", help="ingest the .vtt files in DIR instead of downloading")
+  parser.add_argument("--jobs", type=int, default=FETCH_JOBS, help="subtitle downloads running at once")
+  parser.add_argument("--examples", help="courses directory (default: ../examples)")
+  args = parser.parse_args()
+  assert args.playlist or args.from_dir, "Must provide playlist"
+  if args.from_dir:
+    print(local_generator(args.from_dir, args.name, examples=args.examples, title=args.title, jobs=args.jobs))
+  else:
+    print(json_generator(args.playlist, args.name, examples=args.examples, title=args.title, jobs=args.jobs))
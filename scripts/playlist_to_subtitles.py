@@ -1,4 +1,5 @@
 from __future__ import unicode_literals
+import os
 import youtube_dl
 import sys
 
@@ -12,7 +13,26 @@ def process_playlist(link):
   with youtube_dl.YoutubeDL(ydl_opts) as ydl:
       ydl.download([link])
 
+"""
+Lists the videos of a playlist as dicts with their id and title, without
+resolving each video.
+"""
+def playlist_entries(link):
+  ydl_opts = {"ignoreerrors": True, "extract_flat": "in_playlist", "quiet": True}
+  with youtube_dl.YoutubeDL(ydl_opts) as ydl:
+    info = ydl.extract_info(link, download=False)
+  return [{"id": entry["id"], "title": entry.get("title")} for entry in info.get("entries") or [] if entry]
+
+"""
+Downloads the auto generated subtitles of one video into directory, named
+like process_playlist names them.
+"""
+def fetch_subtitles(video_id, directory):
+  ydl_opts = {"writeautomaticsub": True, "skip_download": True, "quiet": True, "outtmpl" : os.path.join(directory, "Title=%(title)s_Id=%(id)s")}
+  with youtube_dl.YoutubeDL(ydl_opts) as ydl:
+    ydl.download(["https://www.youtube.com/watch?v=" + video_id])
+
 if __name__ == '__main__':
   args = sys.argv
   assert len(args) == 2, "Must provide playlist"
-  process_playlist(args[1])
\ No newline at end of file
+  process_playlist(args[1])
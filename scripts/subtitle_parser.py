@@ -1,45 +1,289 @@
+import argparse
+import hashlib
 import json
 import re
 import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
 
 # regex parsers
 lecture_matcher = re.compile("(.*).en.vtt") # YouTube code only
 timestamp_matcher = re.compile("(\\d\\d):(\\d\\d):(\\d\\d).\\d\\d\\d --> \\d\\d:\\d\\d:\\d\\d.\\d\\d\\d")
+cue_matcher = re.compile("(\\d\\d):(\\d\\d):(\\d\\d)\\.(\\d\\d\\d) --> (\\d\\d):(\\d\\d):(\\d\\d)\\.(\\d\\d\\d)")
+word_tag_matcher = re.compile("<(\\d\\d):(\\d\\d):(\\d\\d)\\.(\\d\\d\\d)><c[^>]*>(.*?)</c>")
+
+# per-file parse results kept by --output, inside the subtitle directory
+CACHE_DIR = ".parsed"
+MANIFEST = "manifest.json"
+
+"""
+Returns the subtitle files of a directory, sorted by name.
+"""
+def subtitle_files(directory):
+  return sorted(filename for filename in os.listdir(directory) if filename.endswith(".vtt"))
+
+"""
+Parses one .vtt file into its lecture code and a dict of starting second -> phrase.
+"""
+def parse_file(path):
+  lecture_obj = lecture_matcher.match(os.path.basename(path))
+  lecture_code = lecture_obj.group(1)
+  file_dict = {}
+  with open(path, encoding="utf8") as file:
+    last_time = None
+    found_subtitle = False
+    for line in file:
+      if found_subtitle:
+        file_dict[last_time] = line
+        found_subtitle = False
+      else:
+        timestamp_obj = timestamp_matcher.match(line)
+        if timestamp_obj:
+          hours = timestamp_obj.group(1)
+          minutes = timestamp_obj.group(2)
+          seconds = timestamp_obj.group(3)
+          total_seconds = 60*60*int(hours) + 60*int(minutes) + int(seconds)
+          if total_seconds == last_time:
+            continue
+          found_subtitle = True
+          last_time = total_seconds
+  return lecture_code, file_dict
+
+def _milliseconds(hours, minutes, seconds, millis):
+  return ((60*int(hours) + int(minutes))*60 + int(seconds))*1000 + int(millis)
+
+"""
+Parses one .vtt file into its lecture code and every spoken word as
+(start in milliseconds, word), in order.
+
+YouTube auto-captions time every word with <hh:mm:ss.mmm><c> word</c> tags
+after the first word of a caption, which starts with its cue. Their cues
+repeat the previous caption above the new one (and again in 10ms cues
+between captions), so untagged lines are only taken when they differ from
+the last caption. Files without word tags are manual captions: every line
+is new, and its words are spread evenly over the cue.
+"""
+def parse_words_file(path):
+  lecture_code = lecture_matcher.match(os.path.basename(path)).group(1)
+  with open(path, encoding="utf8") as file:
+    content = file.read()
+  timed = "<c>" in content or "<c." in content
+  words = []
+  last_caption = None
+  for block in content.split("\n\n"):
+    lines = block.split("\n")
+    cue = next((i for i, line in enumerate(lines) if cue_matcher.match(line)), None)
+    if cue is None:
+      continue
+    times = cue_matcher.match(lines[cue]).groups()
+    start, end = _milliseconds(*times[:4]), _milliseconds(*times[4:])
+    if not timed:
+      cue_words = " ".join(lines[cue + 1:]).split()
+      step = (end - start) // len(cue_words) if cue_words else 0
+      words.extend((start + i * step, word) for i, word in enumerate(cue_words))
+      continue
+    for line in lines[cue + 1:]:
+      if not line.strip():
+        continue
+      if "<" in line:
+        words.extend((start, word) for word in line[:line.index("<")].split())
+        for tag in word_tag_matcher.finditer(line):
+          words.extend((_milliseconds(*tag.group(1, 2, 3, 4)), word) for word in tag.group(5).split())
+        last_caption = " ".join(re.sub("<[^>]*>", "", line).split())
+      elif " ".join(line.split()) != last_caption:
+        words.extend((start, word) for word in line.split())
+        last_caption = " ".join(line.split())
+  return lecture_code, words
+
+"""
+Parses all .vtt files of a directory into lecture code -> [(milliseconds, word)].
+"""
+def parse_words(directory=None):
+  directory = directory or os.getcwd()
+  return dict(parse_words_file(os.path.join(directory, filename)) for filename in subtitle_files(directory))
 
 """
 Parses all .vtt files in the current directory and prints to stdout a formatted json.
 
 Piping into files in parent directories recommended.
 """
-def parse():
+def parse(directory=None):
+  directory = directory or os.getcwd()
   subtitle_dict = {}
-  for filename in os.listdir(os.getcwd()):
-    if filename == "subtitle_parser.py": # ignore self
-      continue
-    lecture_obj = lecture_matcher.match(filename)
-    lecture_code = lecture_obj.group(1)
-    file_dict = {}
-    with open(filename, encoding="utf8") as file:
-      last_time = None
-      found_subtitle = False
-      for line in file:
-        if found_subtitle:
-          file_dict[last_time] = line
-          found_subtitle = False
-        else:
-          timestamp_obj = timestamp_matcher.match(line)
-          if timestamp_obj:
-            hours = timestamp_obj.group(1)
-            minutes = timestamp_obj.group(2)
-            seconds = timestamp_obj.group(3)
-            total_seconds = 60*60*int(hours) + 60*int(minutes) + int(seconds)
-            if total_seconds == last_time:
-              continue
-            found_subtitle = True
-            last_time = total_seconds
-      subtitle_dict[lecture_code] = file_dict
+  for filename in subtitle_files(directory):
+    lecture_code, file_dict = parse_file(os.path.join(directory, filename))
+    subtitle_dict[lecture_code] = file_dict
   return subtitle_dict
 
-if __name__ == '__main__':
-  print(json.dumps(parse(), indent = 4, sort_keys=True))
+"""
+Parses one file into the text it contributes to the course json: its
+"lecture code": {...} member, formatted exactly as json.dumps(indent=4,
+sort_keys=True) formats it inside the whole course.
+"""
+def _parse_member(path):
+  lecture_code, file_dict = parse_file(path)
+  return lecture_code, json.dumps({lecture_code: file_dict}, indent = 4, sort_keys=True)[2:-2]
+
+def _file_hash(path):
+  digest = hashlib.sha1(os.path.basename(path).encode("utf8"))
+  with open(path, "rb") as file:
+    for block in iter(lambda: file.read(1 << 16), b""):
+      digest.update(block)
+  return digest.hexdigest()
 
+"""
+The parsed json members of a directory of .vtt files, kept in
+<directory>/.parsed between runs.
+
+A manifest records the mtime, size and hash of the name and content of every
+file; a file is only parsed again when those change.
+"""
+class ParseCache(object):
+
+  def __init__(self, directory):
+    self.directory = directory
+    self.cache_dir = os.path.join(directory, CACHE_DIR)
+    os.makedirs(self.cache_dir, exist_ok=True)
+    self.manifest_path = os.path.join(self.cache_dir, MANIFEST)
+    try:
+      with open(self.manifest_path) as file:
+        self.entries = json.load(file)
+    except (OSError, ValueError):
+      self.entries = {}
+
+  def _check(self, filename):
+    """
+    Brings the manifest entry of a file up to date and returns whether the
+    file has to be parsed
+    """
+    path = os.path.join(self.directory, filename)
+    stat = os.stat(path)
+    entry = self.entries.get(filename)
+    if entry is not None and (entry["mtime_ns"] != stat.st_mtime_ns or entry["size"] != stat.st_size):
+      digest = _file_hash(path)
+      if entry["sha1"] == digest:
+        entry = dict(entry, mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+      else:
+        entry = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "sha1": digest}
+    elif entry is None:
+      entry = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "sha1": _file_hash(path)}
+    self.entries[filename] = entry
+    return "lecture_code" not in entry or not os.path.exists(self._member_path(entry))
+
+  def _member_path(self, entry):
+    return os.path.join(self.cache_dir, entry["sha1"] + ".json")
+
+  def _store(self, filename, lecture_code, member):
+    entry = self.entries[filename]
+    entry["lecture_code"] = lecture_code
+    with open(self._member_path(entry), "w", encoding="utf8") as file:
+      file.write(member)
+
+  def update(self, filename):
+    """
+    Parses one file of the directory if it is new or changed. Returns whether
+    it was parsed.
+    """
+    if not self._check(filename):
+      return False
+    self._store(filename, *_parse_member(os.path.join(self.directory, filename)))
+    return True
+
+  def refresh(self, jobs=None):
+    """
+    Brings every file of the directory up to date, parsing new or changed ones
+    in parallel over a process pool of jobs workers, and forgets files that
+    were deleted. Returns the names of the files that were parsed.
+    """
+    filenames = subtitle_files(self.directory)
+    for filename in set(self.entries) - set(filenames):
+      del self.entries[filename]
+    changed = [filename for filename in filenames if self._check(filename)]
+    paths = [os.path.join(self.directory, filename) for filename in changed]
+    if len(paths) > 1 and jobs != 1:
+      with ProcessPoolExecutor(max_workers=jobs) as pool:
+        for filename, member in zip(changed, pool.map(_parse_member, paths, chunksize=max(1, len(paths) // 32))):
+          self._store(filename, *member)
+    else:
+      for filename, path in zip(changed, paths):
+        self._store(filename, *_parse_member(path))
+    return changed
+
+  def write_json(self, output):
+    """
+    Writes the course json member by member into a temporary file and moves
+    it into place. The result is identical to the json printed by parse().
+    """
+    ordered = sorted(self.entries.values(), key=lambda entry: entry["lecture_code"])
+    tmp_output = output + ".tmp"
+    with open(tmp_output, "w", encoding="utf8") as out:
+      out.write("{\n")
+      for i, entry in enumerate(ordered):
+        if i:
+          out.write(",\n")
+        with open(self._member_path(entry), encoding="utf8") as member:
+          out.write(member.read())
+      out.write("\n}\n" if ordered else "}\n")
+    os.replace(tmp_output, output)
+
+  def save(self):
+    """
+    Writes the manifest and removes members no file refers to any more
+    """
+    tmp_manifest = self.manifest_path + ".tmp"
+    with open(tmp_manifest, "w") as file:
+      json.dump(self.entries, file, indent = 2, sort_keys=True)
+    os.replace(tmp_manifest, self.manifest_path)
+    used = {os.path.basename(self._member_path(entry)) for entry in self.entries.values()} | {MANIFEST}
+    for filename in os.listdir(self.cache_dir):
+      if filename not in used:
+        os.remove(os.path.join(self.cache_dir, filename))
+
+"""
+Writes the course json for a directory of .vtt files to output, re-parsing
+only the files that are new or changed since the last run (see ParseCache).
+Changed files are parsed in parallel and the output is streamed member by
+member instead of dumping one dict of the whole course.
+"""
+def parse_incremental(output, directory=None, jobs=None):
+  cache = ParseCache(directory or os.getcwd())
+  changed = cache.refresh(jobs)
+  cache.write_json(output)
+  cache.save()
+  return changed
+
+"""
+Writes the parsed subtitles as a memory-mapped course file (see course_file.py)
+instead of json, in the same order the json output uses.
+"""
+def write_binary(filename):
+  sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+  from course_file import write_course
+  subtitle_dict = parse()
+  write_course({lecture_code: subtitle_dict[lecture_code] for lecture_code in sorted(subtitle_dict)}, filename)
+
+"""
+Writes the word timings of the .vtt files in the current directory as a word
+file (see word_timings.py), in the order the json output uses.
+"""
+def write_words_file(filename):
+  sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+  from word_timings import write_words
+  words = parse_words()
+  write_words({lecture_code: words[lecture_code] for lecture_code in sorted(words)}, filename)
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description="Parses the .vtt files in the current directory into a course json.")
+  parser.add_argument("--binary", metavar="FILE", help="write a course file instead of json")
+  parser.add_argument("--words", metavar="FILE", help="write the word timings as a word file")
+  parser.add_argument("--output", metavar="FILE", help="write json to FILE, only re-parsing new or changed files")
+  parser.add_argument("--jobs", type=int, help="parser processes for --output (default: one per CPU)")
+  args = parser.parse_args()
+  if args.words:
+    write_words_file(args.words)
+  elif args.binary:
+    write_binary(args.binary)
+  elif args.output:
+    parse_incremental(args.output, jobs=args.jobs)
+  else:
+    print(json.dumps(parse(), indent = 4, sort_keys=True))
@@ -0,0 +1,15 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+# main reads the catalog from examples/ in the working directory
+os.chdir(ROOT)
+
+@pytest.fixture
+def client():
+  import main
+  main.result_cache.invalidate()
+  return main.app.test_client()
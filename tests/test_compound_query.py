@@ -0,0 +1,66 @@
+import pytest
+
+from compound_query import Query, lecture_matches, parse_query, parse_time, run_query
+from course_index import load_course
+
+COURSE = "examples/andrew_ng/andrew_ng.json"
+
+@pytest.fixture(scope="module")
+def course():
+  return load_course(COURSE)
+
+@pytest.mark.parametrize("text, query", [
+  ("bias NEAR variance", Query(["bias", "variance"], [30], [], None, None)),
+  ("bias NEAR/5 high variance", Query(["bias", "high variance"], [5], [], None, None)),
+  ("gradient lecture:2 lecture:3.1", Query(["gradient"], [], ["2", "3.1"], None, None)),
+  ("learning from:1:00 to:1:02:03", Query(["learning"], [], [], 60, 3723)),
+  ('"NEAR" lecture:4', Query(["NEAR"], [], ["4"], None, None)),
+])
+def test_parse_query(text, query):
+  assert parse_query(text) == query
+
+@pytest.mark.parametrize("text", [
+  "gradient descent",
+  '"bias NEAR variance"',
+  "NEAR variance",
+  "bias NEAR",
+  "lecture:2",
+  "learning from:soon",
+])
+def test_plain_or_incomplete_queries_are_not_compound(text):
+  assert parse_query(text) is None
+
+def test_parse_time():
+  assert parse_time("45") == 45
+  assert parse_time("2:30") == 150
+  assert parse_time("1:00:05") == 3605
+  assert parse_time("2m") is None
+
+def test_lecture_matches():
+  title = "Lecture 10.1 — Advice For Applying Machine Learning"
+  assert lecture_matches("10", title, "abc")
+  assert lecture_matches("010.1", title, "abc")
+  assert lecture_matches("1?.*", title, "abc")
+  assert not lecture_matches("1", title, "abc")
+  assert lecture_matches("abc", title, "abc")
+  assert lecture_matches("advice", title, "abc")
+
+def seconds(course, video_idx, index):
+  return course.videos[video_idx].timestamps[index]
+
+def test_near_keeps_matches_with_the_other_term_close(course):
+  trigram_index = course.trigram_index()
+  variance = {}
+  for video_idx, index, _, _ in trigram_index.find("variance"):
+    variance.setdefault(video_idx, []).append(seconds(course, video_idx, index))
+  expected = [hit for hit in trigram_index.find("bias")
+    if any(abs(second - seconds(course, hit[0], hit[1])) <= 5 for second in variance.get(hit[0], ()))]
+  assert expected
+  assert run_query(parse_query("bias NEAR/5 variance"), course) == expected
+
+def test_lecture_and_time_filters(course):
+  hits = run_query(parse_query("learning lecture:2 from:1:00 to:2:00"), course)
+  assert hits
+  expected = [hit for hit in course.trigram_index().find("learning")
+    if lecture_matches("2", course.videos[hit[0]].title, "") and 60 <= seconds(course, hit[0], hit[1]) < 120]
+  assert hits == expected
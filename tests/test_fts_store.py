@@ -0,0 +1,36 @@
+import pytest
+
+from fts_store import FtsStore
+from phrase_occurrences import find_occurrences, page_occurrences, ranked_occurrences
+
+COURSE = "examples/andrew_ng/andrew_ng.json"
+
+@pytest.fixture(scope="module")
+def stored(tmp_path_factory):
+  store = FtsStore(str(tmp_path_factory.mktemp("fts") / "courses.db"))
+  store.ingest("andrew_ng", COURSE)
+  return store.course("andrew_ng")
+
+@pytest.mark.parametrize("term", [
+  "k-", "ux", "then", "of the", "is a", "gradient descent", "learning rate",
+  "regulariz", "it's", '"', "symetry", "cost functon", "zzzq",
+])
+@pytest.mark.parametrize("fuzzy", [False, True])
+def test_matches_the_course_index(stored, term, fuzzy):
+  assert find_occurrences(term, stored, fuzzy) == find_occurrences(term, COURSE, fuzzy)
+
+def test_pages_match_the_course_index(stored):
+  assert page_occurrences("the", stored, 50, after=200) == page_occurrences("the", COURSE, 50, after=200)
+  assert page_occurrences("the", stored, 50, page=2) == page_occurrences("the", COURSE, 50, page=2)
+
+def test_ranking_matches_the_course_index(stored):
+  assert ranked_occurrences("gradient", stored, 20) == ranked_occurrences("gradient", COURSE, 20)
+
+def test_reingest_replaces_the_course(tmp_path):
+  store = FtsStore(str(tmp_path / "courses.db"))
+  store.ingest("andrew_ng", COURSE)
+  store.ingest("andrew_ng", COURSE)
+  assert store.slugs() == ["andrew_ng"]
+  assert find_occurrences("bias", store.course("andrew_ng")) == find_occurrences("bias", COURSE)
+  store.remove("andrew_ng")
+  assert store.course("andrew_ng") is None
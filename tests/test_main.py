@@ -0,0 +1,75 @@
+import pytest
+
+@pytest.mark.parametrize("url", [
+  "/andrew_ng/learn?page=-1",
+  "/andrew_ng/learn?page=-1&sort=relevance",
+  "/andrew_ng/learn?after=-3",
+  "/api/andrew_ng/search?q=learn&page=-1",
+  "/api/andrew_ng/search?q=learn&page=-1&sort=relevance",
+  "/api/andrew_ng/search?q=learn&after=-2",
+])
+def test_negative_pages_are_rejected(client, url):
+  assert client.get(url).status_code == 400
+
+@pytest.mark.parametrize("url", [
+  "/andrew_ng/learn?page=0&after=-1",
+  "/api/andrew_ng/search?q=learn&page=0&after=-1",
+])
+def test_first_page_is_accepted(client, url):
+  assert client.get(url).status_code == 200
+
+def searches(client):
+  for line in client.get('/metrics').get_data(as_text=True).splitlines():
+    if line.startswith('coursestamp_searches_total{course="andrew_ng"}'):
+      return int(line.split()[-1])
+  return 0
+
+def test_streamed_search_is_recorded(client):
+  before = searches(client)
+  response = client.get('/api/andrew_ng/search?q=learn&format=ndjson&limit=5')
+  assert len(response.get_data().splitlines()) == 5
+  assert searches(client) == before + 1
+
+def api(client, query, **args):
+  response = client.get('/api/andrew_ng/search', query_string=dict(q=query, **args))
+  assert response.status_code == 200
+  return response.get_json()
+
+def test_repeated_search_is_served_from_the_cache(client):
+  import main
+  first = api(client, 'gradient', limit=5)
+  hits = main.result_cache.stats()['hits']
+  assert api(client, 'Gradient', limit=5) == dict(first, query='Gradient')
+  assert main.result_cache.stats()['hits'] == hits + 1
+
+def test_matching_etag_is_not_modified(client):
+  response = client.get('/api/andrew_ng/search?q=gradient')
+  etag = response.headers['ETag']
+  assert client.get('/api/andrew_ng/search?q=gradient', headers={'If-None-Match': etag}).status_code == 304
+  assert client.get('/api/andrew_ng/search?q=gradient&limit=5', headers={'If-None-Match': etag}).status_code == 200
+
+def test_cursor_pages_cover_every_result(client):
+  every = api(client, 'overfitting', limit=100)
+  assert every['next'] is None
+  results = []
+  after = -1
+  while after is not None:
+    page = api(client, 'overfitting', limit=7, after=after)
+    results += page['results']
+    after = page['next']
+  assert results == every['results']
+  assert api(client, 'overfitting', limit=7, page=1) == api(client, 'overfitting', limit=7, after=every['results'][6]['cursor'])
+
+def test_ranked_pages_follow_each_other(client):
+  every = api(client, 'gradient', limit=30, sort='relevance')
+  first = api(client, 'gradient', limit=10, sort='relevance')
+  second = api(client, 'gradient', limit=10, sort='relevance', page=first['next'])
+  assert first['next'] == 1
+  assert first['results'] + second['results'] == every['results'][:20]
+
+def test_compound_queries_are_searched_with_operators(client):
+  near = api(client, 'bias NEAR/5 variance', limit=100)['results']
+  assert near
+  assert len(near) < len(api(client, 'bias', limit=100)['results'])
+  assert all(result['context'][result['term_idx']:].lower().startswith('bias') for result in near)
+  assert api(client, '"bias NEAR/5 variance"')['results'] == []
@@ -0,0 +1,101 @@
+import threading
+import time
+
+import pytest
+
+import result_cache
+from result_cache import ResultCache
+
+class Clock(object):
+
+  def __init__(self):
+    self.now = 0.0
+
+  def monotonic(self):
+    return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+  clock = Clock()
+  monkeypatch.setattr(result_cache.time, "monotonic", clock.monotonic)
+  return clock
+
+def test_hits_reuse_the_computed_result():
+  cache = ResultCache()
+  calls = []
+  compute = lambda: calls.append(1) or len(calls)
+  assert cache.get("key", 1, compute) == 1
+  assert cache.get("key", 1, compute) == 1
+  assert len(calls) == 1
+  assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+def test_least_recently_used_entry_is_evicted():
+  cache = ResultCache(max_entries=2)
+  cache.get("a", 1, lambda: "a")
+  cache.get("b", 1, lambda: "b")
+  cache.get("a", 1, lambda: "stale")
+  cache.get("c", 1, lambda: "c")
+  assert cache.get("a", 1, lambda: "again") == "a"
+  assert cache.get("b", 1, lambda: "again") == "again"
+  assert cache.stats()["evictions"] == 2
+
+def test_entries_expire_after_ttl(clock):
+  cache = ResultCache(ttl=10)
+  cache.get("key", 1, lambda: "old")
+  clock.now = 10
+  assert cache.get("key", 1, lambda: "new") == "old"
+  clock.now = 10.5
+  assert cache.get("key", 1, lambda: "new") == "new"
+  assert cache.stats()["expirations"] == 1
+
+def test_new_course_version_recomputes():
+  cache = ResultCache()
+  cache.get("key", 1, lambda: "old")
+  assert cache.get("key", 2, lambda: "new") == "new"
+  assert cache.get("key", 2, lambda: "newer") == "new"
+  assert cache.stats()["invalidations"] == 1
+
+def test_invalidate_matching_keys():
+  cache = ResultCache()
+  cache.get(("a", 1), 1, lambda: "a")
+  cache.get(("b", 1), 1, lambda: "b")
+  cache.invalidate(lambda key: key[0] == "a")
+  assert cache.stats()["entries"] == 1
+  assert cache.get(("b", 1), 1, lambda: "again") == "b"
+  cache.invalidate()
+  assert cache.stats()["entries"] == 0
+
+def test_concurrent_misses_are_computed_once():
+  cache = ResultCache()
+  started = threading.Event()
+  release = threading.Event()
+  calls = []
+  def compute():
+    calls.append(1)
+    started.set()
+    release.wait(5)
+    return "result"
+  results = []
+  leader = threading.Thread(target=lambda: results.append(cache.get("key", 1, compute)))
+  leader.start()
+  started.wait(5)
+  followers = [threading.Thread(target=lambda: results.append(cache.get("key", 1, compute))) for _ in range(3)]
+  for follower in followers:
+    follower.start()
+  deadline = time.monotonic() + 5
+  while cache.stats()["coalesced"] < 3 and time.monotonic() < deadline:
+    time.sleep(0.001)
+  release.set()
+  for thread in [leader] + followers:
+    thread.join(5)
+  assert results == ["result"] * 4
+  assert len(calls) == 1
+  assert cache.stats()["coalesced"] == 3
+
+def test_failures_are_not_cached():
+  cache = ResultCache()
+  def fail():
+    raise ValueError("boom")
+  with pytest.raises(ValueError):
+    cache.get("key", 1, fail)
+  assert cache.get("key", 1, lambda: "ok") == "ok"
@@ -0,0 +1,279 @@
+import re
+from array import array
+from bisect import bisect_right
+from functools import lru_cache
+from aho_corasick import automaton
+from inverted_index import top_hits
+
+# edits cannot be allowed for very short phrases without matching nearly everything
+FUZZY_MIN_LENGTH = 5
+# characters of context shown on each side of a match
+CONTEXT_CHARS = 40
+# whitespace that separates words within and across subtitle lines
+SPACES = str.maketrans("\n\r\t", "   ")
+# needles searched together below which one str.find scan per needle beats the automaton
+AUTOMATON_MIN_TERMS = 600
+
+"""
+Returns the set of three character substrings of text.
+"""
+def trigrams(text):
+  return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+"""
+Compiles a regex matching every string within edit distance 1 of needle:
+one character substituted, deleted or inserted.
+"""
+@lru_cache(maxsize=256)
+def fuzzy_pattern(needle):
+  variants = []
+  for i in range(len(needle) + 1):
+    head, tail = re.escape(needle[:i]), re.escape(needle[i + 1:])
+    if i < len(needle):
+      variants.append(head + "." + tail)
+      variants.append(head + tail)
+    variants.append(head + "." + re.escape(needle[i:]))
+  return re.compile("|".join(variants))
+
+
+"""
+Returns (first, stop) of the context shown for a match of length characters
+at offset in text, about CONTEXT_CHARS on each side without leaving lo:hi
+or cutting a word in half. Words in text are separated by single spaces.
+"""
+def context_window(text, offset, length, lo, hi):
+  first = max(lo, offset - CONTEXT_CHARS)
+  stop = min(hi, offset + length + CONTEXT_CHARS)
+  if first > lo and text[first - 1] != " ":
+    space = text.find(" ", first, offset)
+    if space != -1:
+      first = space + 1
+  if stop < hi and text[stop] != " ":
+    space = text.rfind(" ", offset + length, stop)
+    if space != -1:
+      stop = space
+  return first, stop
+
+
+"""
+Substring index over the subtitles of one course, kept as contiguous text.
+
+The lines of the course are joined into one buffer in course order, with
+line_starts giving each line's offset, so a video is one slice of it. In the
+lowercased copy that is searched, line breaks are spaces: a phrase that the
+captions split over two cues is found like any other, and reported at the
+line it starts in. Offsets map back to lines, and so to timestamps, by
+bisecting line_starts.
+
+For every trigram the index keeps the sorted indexes of the videos containing
+it. A phrase can only occur in videos that contain each of its trigrams, and
+only those videos are scanned, with str.find (or a regex for fuzzy searches)
+over their part of the buffer.
+"""
+class TrigramIndex(object):
+
+  def __init__(self, course):
+    self.video_starts = course.video_starts
+    self.video_lengths = []
+    self.line_starts = array("i", [0])
+    text = []
+    lowered = []
+    postings = {}
+    for video_idx, video in enumerate(course.videos):
+      video_lowered = []
+      for line, line_lowered in zip(video.lines, video.lowered):
+        if len(line_lowered) != len(line):
+          # lowercasing changed the length; search the line as it is so offsets line up
+          line_lowered = line
+        if line and not line[-1].isspace():
+          line += "\n"
+          line_lowered += "\n"
+        text.append(line)
+        video_lowered.append(line_lowered)
+        self.line_starts.append(self.line_starts[-1] + len(line))
+      video_lowered = "".join(video_lowered).translate(SPACES)
+      for gram in trigrams(video_lowered):
+        ids = postings.get(gram)
+        if ids is None:
+          ids = postings[gram] = array("i")
+        ids.append(video_idx)
+      lowered.append(video_lowered)
+      self.video_lengths.append(sum(map(len, video.lowered)))
+    self.text = "".join(text)
+    self.lowered = "".join(lowered)
+    self.postings = postings
+
+  def locate(self, line_id):
+    """
+    Maps a global line id back to (video index, line index within the video)
+    """
+    video_idx = bisect_right(self.video_starts, line_id) - 1
+    return video_idx, line_id - self.video_starts[video_idx]
+
+  def line_at(self, offset):
+    """
+    The global line id of the line holding a buffer offset
+    """
+    return bisect_right(self.line_starts, offset) - 1
+
+  def candidates(self, needle):
+    """
+    Indexes, in order, of the videos holding every trigram of needle
+    """
+    grams = trigrams(needle)
+    if not grams:
+      return range(len(self.video_lengths))
+    lists = []
+    for gram in grams:
+      ids = self.postings.get(gram)
+      if ids is None:
+        return ()
+      lists.append(ids)
+    lists.sort(key=len)
+    videos = set(lists[0])
+    for ids in lists[1:]:
+      videos.intersection_update(ids)
+    return sorted(videos)
+
+  def fuzzy_candidates(self, needle):
+    """
+    Indexes, in order, of the videos that could hold needle with one edit.
+    One edit destroys at most three trigrams, so every other trigram must be
+    present; short needles have too few trigrams to rule anything out.
+    """
+    grams = trigrams(needle)
+    required = len(grams) - 3
+    if required <= 0:
+      return range(len(self.video_lengths))
+    counts = {}
+    for gram in grams:
+      for video_idx in self.postings.get(gram, ()):
+        counts[video_idx] = counts.get(video_idx, 0) + 1
+    return sorted(video_idx for video_idx, count in counts.items() if count >= required)
+
+  def iter_find(self, needle, fuzzy=False, after=-1):
+    """
+    Yields (line id, start character, length) for the first match of the
+    lowercased needle starting in each line after the given line id, in
+    course order; fuzzy matches may be a character longer or shorter than
+    needle. Matches may run on into the next lines of the same video. Videos
+    are only scanned as the caller consumes matches.
+    """
+    for video_idx, line_id, start, length in self._matches(needle, fuzzy, after):
+      yield line_id, start, length
+
+  def _matches(self, needle, fuzzy, after, videos=None):
+    text, line_starts = self.lowered, self.line_starts
+    if after + 1 >= len(line_starts) - 1:
+      return
+    fuzzy = fuzzy and len(needle) >= FUZZY_MIN_LENGTH
+    candidates = self.fuzzy_candidates(needle) if fuzzy else self.candidates(needle)
+    first_video = self.locate(after + 1)[0]
+    for video_idx in candidates:
+      if video_idx < first_video or videos is not None and not videos[video_idx]:
+        continue
+      first_line, last_line = self.video_starts[video_idx], self.video_starts[video_idx + 1]
+      pos = max(line_starts[first_line], line_starts[after + 1])
+      stop = line_starts[last_line]
+      exact = close = None
+      while pos < stop:
+        if exact is None or -1 < exact < pos:
+          exact = text.find(needle, pos, stop)
+        found, length = exact, len(needle)
+        if fuzzy:
+          if close is None or -1 < close[0] < pos:
+            close = self._fuzzy_find(needle, pos, stop)
+          # an exact match wins over a fuzzy one in the same line
+          if close[0] != -1 and (found == -1 or close[0] < line_starts[self.line_at(found)]):
+            found, length = close[0], close[1] - close[0]
+        if found == -1:
+          break
+        line_id = bisect_right(line_starts, found, first_line, last_line) - 1
+        yield video_idx, line_id, found - line_starts[line_id], length
+        pos = line_starts[line_id + 1]
+
+  def _fuzzy_find(self, needle, pos, stop):
+    """
+    (start, end) of the first match within one edit of needle in
+    lowered[pos:stop], or (-1, -1). One edit leaves one half of needle
+    intact, so the fuzzy pattern only runs around occurrences of either
+    half. A match around an occurrence starts at or before it; one found
+    starting later may be cut short by the end of the window, and is left
+    to the occurrence it starts around.
+    """
+    text = self.lowered
+    pattern = fuzzy_pattern(needle)
+    half = len(needle) // 2
+    head, tail = needle[:half], needle[half:]
+    reach = len(needle) + 1
+    start = pos
+    while True:
+      at_head = text.find(head, start, stop)
+      at_tail = text.find(tail, start, stop)
+      if at_head == -1 and at_tail == -1:
+        return -1, -1
+      at = min(at for at in (at_head, at_tail) if at != -1)
+      match = pattern.search(text, max(pos, at - reach), min(stop, at + reach))
+      if match is not None and match.start() <= at:
+        return match.span()
+      start = at + 1
+
+  def find(self, needle, fuzzy=False, videos=None):
+    """
+    Returns every match of the lowercased needle as
+    (video index, line index, start character, length), in course order.
+    videos optionally holds a byte per video, set for the videos to search.
+    """
+    video_starts = self.video_starts
+    return [(video_idx, line_id - video_starts[video_idx], start, length)
+      for video_idx, line_id, start, length in self._matches(needle, fuzzy, -1, videos)]
+
+  def find_many(self, needles):
+    """
+    Returns the matches of each lowercased needle, as find would, in one
+    list per needle. Sets of at least AUTOMATON_MIN_TERMS needles are found
+    together by one Aho-Corasick scan over the videos that could hold any of
+    them; smaller ones are faster to find one at a time with str.find.
+    """
+    if len(needles) < AUTOMATON_MIN_TERMS or "" in needles:
+      return [self.find(needle) for needle in needles]
+    terms = tuple(sorted(set(needles)))
+    videos = set()
+    for term in terms:
+      videos.update(self.candidates(term))
+    text, line_starts, video_starts = self.lowered, self.line_starts, self.video_starts
+    found = [[] for _ in terms]
+    last_lines = [-1] * len(terms)
+    scanner = automaton(terms)
+    for video_idx in sorted(videos):
+      first_line, last_line = video_starts[video_idx], video_starts[video_idx + 1]
+      for start, term_idx in scanner.iter_matches(text, line_starts[first_line], line_starts[last_line]):
+        line_id = bisect_right(line_starts, start, first_line, last_line) - 1
+        # a needle's matches come in order, so the first in a line is kept
+        if line_id != last_lines[term_idx]:
+          last_lines[term_idx] = line_id
+          found[term_idx].append((video_idx, line_id - first_line, start - line_starts[line_id], len(terms[term_idx])))
+    positions = {term: term_idx for term_idx, term in enumerate(terms)}
+    return [found[positions[needle]] for needle in needles]
+
+  def snippet(self, line_id, start, length):
+    """
+    The context of a match of length characters at start of a line: a
+    slice of the video's text about CONTEXT_CHARS wide on each side, where
+    the match starts in it, and the id of the line the slice starts in
+    """
+    line_starts = self.line_starts
+    offset = line_starts[line_id] + start
+    video_idx = bisect_right(self.video_starts, line_id) - 1
+    first_line = self.video_starts[video_idx]
+    lo, hi = line_starts[first_line], line_starts[self.video_starts[video_idx + 1]]
+    first, stop = context_window(self.lowered, offset, length, lo, hi)
+    return self.text[first:stop], offset - first, bisect_right(line_starts, first, first_line, line_id + 1) - 1
+
+  def search(self, needle, limit, fuzzy=False):
+    """
+    Returns the limit best matches; lectures are ranked by BM25, treating
+    needle as a single term, and matches inside a lecture keep their order
+    """
+    return top_hits(self.find(needle, fuzzy), self.video_lengths, limit)
@@ -0,0 +1,210 @@
+import heapq
+import mmap
+import os
+import struct
+import sys
+import threading
+from array import array
+from bisect import bisect_left
+from inverted_index import token_matcher
+
+VOCABULARY_SUFFIX = ".vocab"
+MAGIC = b"CSVOCAB1"
+# magic, terms, text bytes
+HEADER = struct.Struct("<8sII")
+# two-word phrases said fewer times than this are not suggested
+BIGRAM_MIN_COUNT = 3
+# suggestions returned by default
+SUGGESTIONS = 8
+# prefixes completing to more terms than this have their suggestions remembered
+SCAN_LIMIT = 512
+
+"""
+The words and frequent two-word phrases of a course with how often each is
+said, for suggesting searches as they are typed.
+
+Terms are counted in the lowercased text the trigram index searches, and a
+two-word phrase is only counted where its words are separated by a single
+space there, so every suggestion has results. A vocabulary file holds the
+terms sorted by their UTF-8 bytes, so the completions of a prefix are one
+range found by bisection, and the most frequent of them are picked from the
+counts with a heap. Like course files, vocabulary files are memory-mapped.
+
+Layout, all integers little-endian int32, right after the header:
+  term_offsets[terms + 1]  each term in the text blob
+  counts[terms]            times each term is said
+followed by the text blob (UTF-8).
+"""
+
+"""
+The lowercased text of each video of a CourseIndex, as its trigram index
+searches it
+"""
+def video_texts(course):
+  trigram_index = course.trigram_index()
+  text, line_starts, video_starts = trigram_index.lowered, trigram_index.line_starts, trigram_index.video_starts
+  for video_idx in range(len(course.videos)):
+    yield text[line_starts[video_starts[video_idx]]:line_starts[video_starts[video_idx + 1]]]
+
+"""
+Counts the terms in the searched text of every video: {term: times said}
+"""
+def count_terms(texts):
+  counts = {}
+  bigrams = {}
+  for text in texts:
+    previous = None
+    for token in token_matcher.finditer(text):
+      word = token.group()
+      counts[word] = counts.get(word, 0) + 1
+      if previous is not None and previous.end() + 1 == token.start() and text[previous.end()] == " ":
+        bigram = previous.group() + " " + word
+        bigrams[bigram] = bigrams.get(bigram, 0) + 1
+      previous = token
+  counts.update((bigram, count) for bigram, count in bigrams.items() if count >= BIGRAM_MIN_COUNT)
+  return counts
+
+"""
+Encodes {term: count} in the vocabulary file format
+"""
+def encode_vocabulary(counts):
+  terms = sorted((term.encode("utf-8"), count) for term, count in counts.items())
+  term_offsets = array("i", [0])
+  term_counts = array("i")
+  text = bytearray()
+  for term, count in terms:
+    text += term
+    term_offsets.append(len(text))
+    term_counts.append(count)
+  if sys.byteorder != "little":
+    term_offsets.byteswap()
+    term_counts.byteswap()
+  return HEADER.pack(MAGIC, len(terms), len(text)) + term_offsets.tobytes() + term_counts.tobytes() + bytes(text)
+
+"""
+Writes the vocabulary file of a course json or course file next to it; the
+file is replaced atomically
+"""
+def write_vocabulary(course, filename):
+  tmp_filename = filename + ".tmp"
+  with open(tmp_filename, "wb") as file:
+    file.write(encode_vocabulary(count_terms(video_texts(course))))
+  os.replace(tmp_filename, filename)
+
+"""
+The path of the vocabulary file for a course json or course file, whether
+or not it exists
+"""
+def vocabulary_path(filename):
+  return os.path.splitext(filename)[0] + VOCABULARY_SUFFIX
+
+"""
+The Vocabulary of the course loaded from filename: the vocabulary file next
+to it when that is at least as new as the course, otherwise counted from the
+video texts texts() returns
+"""
+def course_vocabulary(filename, texts):
+  path = vocabulary_path(filename)
+  try:
+    if os.stat(path).st_mtime_ns >= os.stat(filename).st_mtime_ns:
+      with open(path, "rb") as file:
+        return Vocabulary(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+  except OSError:
+    pass
+  return Vocabulary(encode_vocabulary(count_terms(texts())))
+
+
+class Vocabulary(object):
+
+  def __init__(self, data):
+    self.data = data
+    view = memoryview(data)
+    magic, terms, text_size = HEADER.unpack_from(data)
+    if magic != MAGIC:
+      raise ValueError("not a vocabulary file")
+    offset = HEADER.size
+    self.term_offsets = view[offset:offset + 4 * (terms + 1)].cast("i")
+    offset += 4 * (terms + 1)
+    self.counts = view[offset:offset + 4 * terms].cast("i")
+    offset += 4 * terms
+    if sys.byteorder != "little":
+      self.term_offsets = array("i", self.term_offsets)
+      self.term_offsets.byteswap()
+      self.counts = array("i", self.counts)
+      self.counts.byteswap()
+    self.text = view[offset:offset + text_size]
+    self.terms = _Terms(self)
+    self._remembered = {}
+    self._lock = threading.Lock()
+
+  def __len__(self):
+    return len(self.counts)
+
+  def term(self, term_idx):
+    return str(self.terms[term_idx], "utf-8")
+
+  def complete(self, prefix, limit=SUGGESTIONS):
+    """
+    The limit most said terms starting with the lowercased prefix, as
+    (term, count) pairs, most said first
+    """
+    key = prefix.encode("utf-8")
+    lo = bisect_left(self.terms, key)
+    # no UTF-8 byte is 0xff, so this sorts after every term starting with key
+    hi = bisect_left(self.terms, key + b"\xff", lo)
+    if hi - lo > SCAN_LIMIT:
+      with self._lock:
+        best = self._remembered.get((key, limit))
+      if best is None:
+        best = heapq.nlargest(limit, range(lo, hi), key=self.counts.__getitem__)
+        with self._lock:
+          self._remembered[(key, limit)] = best
+    else:
+      best = heapq.nlargest(limit, range(lo, hi), key=self.counts.__getitem__)
+    return [(self.term(term_idx), self.counts[term_idx]) for term_idx in best]
+
+  def suggest(self, text, limit=SUGGESTIONS):
+    """
+    Completions of a search being typed, as (search, count) pairs. Only
+    searches of one or two words are completed, since longer ones may have
+    no results.
+    """
+    words = text.lower().split()
+    if not words or len(words) > 2:
+      return []
+    prefix = " ".join(words)
+    if text[-1].isspace():
+      prefix += " "
+    return self.complete(prefix, limit)
+
+
+"""
+The sorted terms of a Vocabulary as a sequence of UTF-8 bytes, for bisection
+"""
+class _Terms(object):
+
+  def __init__(self, vocabulary):
+    self.text = vocabulary.text
+    self.offsets = vocabulary.term_offsets
+
+  def __len__(self):
+    return len(self.offsets) - 1
+
+  def __getitem__(self, term_idx):
+    return self.text[self.offsets[term_idx]:self.offsets[term_idx + 1]].tobytes()
+
+"""
+Writes the vocabulary file of a course json next to it, e.g.
+  python vocabulary.py examples/*/*.json
+"""
+def build(json_filename):
+  from course_index import CourseIndex
+  filename = vocabulary_path(json_filename)
+  write_vocabulary(CourseIndex(json_filename, os.stat(json_filename).st_mtime_ns), filename)
+  return filename
+
+if __name__ == '__main__':
+  args = sys.argv
+  assert len(args) > 1, "Must provide course json files"
+  for json_filename in args[1:]:
+    print(build(json_filename))
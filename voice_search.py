@@ -0,0 +1,156 @@
+import json
+import queue
+import threading
+import time
+import uuid
+
+import houndify
+
+# sample rate of the 16-bit mono PCM the browser sends
+SAMPLE_RATE = 16000
+# seconds a session may wait for audio or for the browser to read its events
+SESSION_TIMEOUT = 30
+# limits per worker and per session; the events of each session hold one of
+# the worker's request threads (see gunicorn.conf.py) while it runs, so
+# sessions are kept well below them to leave threads for text search
+MAX_SESSIONS = 8
+MAX_AUDIO_BYTES = 2 * SAMPLE_RATE * 20
+
+"""
+Voice searches recorded in the browser.
+
+The browser opens a session, posts its microphone audio as 16 kHz PCM in
+small pieces and reads the session's events as Server-Sent Events. Requests
+only hand audio to the session; a background thread per session streams it to
+Houndify through StreamingHoundClient.fill and finish, and turns the
+listener callbacks into "partial", "stop", "final" and "error" events.
+
+Sessions live in the memory of one process, so every request of a session
+has to reach the same worker (see gunicorn.conf.py).
+"""
+class VoiceSessions(object):
+
+  def __init__(self, make_client, timeout=SESSION_TIMEOUT, max_sessions=MAX_SESSIONS):
+    self.make_client = make_client
+    self.timeout = timeout
+    self.max_sessions = max_sessions
+    self._sessions = {}
+    self._lock = threading.Lock()
+
+  def create(self, data=None):
+    """
+    Starts a session and returns it, or None when too many are running.
+    data is kept on the session for the caller, e.g. the course searched.
+    """
+    with self._lock:
+      now = time.monotonic()
+      for session_id in [session_id for session_id, session in self._sessions.items() if session.expired(now)]:
+        del self._sessions[session_id]
+      if len(self._sessions) >= self.max_sessions:
+        return None
+      session = VoiceSession(self.make_client(), self.timeout, data)
+      self._sessions[session.id] = session
+    session.start()
+    return session
+
+  def get(self, session_id):
+    with self._lock:
+      return self._sessions.get(session_id)
+
+  def discard(self, session_id):
+    with self._lock:
+      self._sessions.pop(session_id, None)
+
+
+class VoiceSession(houndify.HoundListener):
+
+  def __init__(self, client, timeout, data=None):
+    self.id = uuid.uuid4().hex
+    self.client = client
+    self.timeout = timeout
+    self.data = data
+    self.transcript = ""
+    self.received = 0
+    self.finished = None
+    self._audio = queue.Queue()
+    self._events = queue.Queue()
+    self._thread = threading.Thread(target=self._run, daemon=True)
+
+  def start(self):
+    self._thread.start()
+
+  def expired(self, now):
+    return self.finished is not None and now - self.finished > self.timeout
+
+  def add_audio(self, data):
+    """
+    Queues a piece of audio. Returns False once the session has all the
+    audio it takes.
+    """
+    if self.received + len(data) > MAX_AUDIO_BYTES:
+      self._audio.put(None)
+      return False
+    self.received += len(data)
+    self._audio.put(data)
+    return True
+
+  def end_audio(self):
+    self._audio.put(None)
+
+  def events(self):
+    """
+    Yields (event, data) pairs until the final transcript or an error
+    """
+    while True:
+      try:
+        event, data = self._events.get(timeout=self.timeout)
+      except queue.Empty:
+        yield "error", {"message": "timed out"}
+        return
+      yield event, data
+      if event in ("final", "error"):
+        return
+
+  def onPartialTranscript(self, transcript):
+    self.transcript = transcript
+    self._events.put(("partial", {"transcript": transcript}))
+
+  def _run(self):
+    try:
+      self.client.start(self)
+      while True:
+        try:
+          data = self._audio.get(timeout=self.timeout)
+        except queue.Empty:
+          data = None
+        if data is None:
+          break
+        if self.client.fill(data):
+          self._events.put(("stop", {}))
+          break
+      response = self.client.finish()
+      if response is None or "Error" in response or response.get("Status") == "Error":
+        self._events.put(("error", {"message": "speech recognition failed"}))
+      else:
+        self._events.put(("final", {"transcript": _transcription(response) or self.transcript}))
+    except Exception as error:
+      self._events.put(("error", {"message": str(error)}))
+    finally:
+      self.finished = time.monotonic()
+
+
+def event_stream(events, final_url):
+  """
+  Formats events as Server-Sent Events, adding the search url for the
+  transcript to the final event
+  """
+  for event, data in events:
+    if event == "final":
+      data = dict(data, url=final_url(data["transcript"]))
+    yield "event: %s\ndata: %s\n\n" % (event, json.dumps(data))
+
+def _transcription(response):
+  try:
+    return response["Disambiguation"]["ChoiceData"][0]["Transcription"]
+  except (KeyError, IndexError, TypeError):
+    return ""
@@ -0,0 +1,203 @@
+import mmap
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from course_file import title_matcher
+
+WORDS_SUFFIX = ".words"
+MAGIC = b"CSWORD01"
+# magic, videos, words, names bytes, text bytes, delta bytes
+HEADER = struct.Struct("<8sIIIII")
+# seconds around a subtitle line's timestamp searched for its words
+SEEK_WINDOW = 10
+
+"""
+Word-level timings of a course, written by subtitle_parser.py --words.
+
+Every word of every lecture is stored once, in spoken order, with the
+millisecond it starts at. The words of a video are joined by spaces into one
+UTF-8 block and their start times are delta-encoded as unsigned LEB128
+varints, so most words cost one or two bytes of timing. Like course files,
+word files are memory-mapped read-only.
+
+Layout, all integers little-endian int32, right after the header:
+  word_starts[videos + 1]       first word of each video
+  name_offsets[2 * videos + 1]  title and YouTube id of each video in the names blob
+  text_offsets[videos + 1]      each video's words in the text blob
+  delta_offsets[videos + 1]     each video's start times in the delta blob
+followed by the names, text and delta blobs.
+"""
+
+"""
+Writes a word file from subtitle_parser.parse_words output: a dict of
+"Title=..._Id=..." -> [(milliseconds, word)]. Videos keep the given order.
+The file is replaced atomically.
+"""
+def write_words(videos, filename):
+  word_starts = array("i", [0])
+  name_offsets = array("i", [0])
+  text_offsets = array("i", [0])
+  delta_offsets = array("i", [0])
+  names = bytearray()
+  text = bytearray()
+  deltas = bytearray()
+  for video_title in videos:
+    title_obj = title_matcher.match(video_title)
+    for name in title_obj.group(1, 2):
+      names += name.encode("utf-8")
+      name_offsets.append(len(names))
+    words = videos[video_title]
+    text += " ".join(word for _, word in words).encode("utf-8")
+    text_offsets.append(len(text))
+    _encode_deltas([start for start, _ in words], deltas)
+    delta_offsets.append(len(deltas))
+    word_starts.append(word_starts[-1] + len(words))
+
+  tables = (word_starts, name_offsets, text_offsets, delta_offsets)
+  if sys.byteorder != "little":
+    for table in tables:
+      table.byteswap()
+  tmp_filename = filename + ".tmp"
+  with open(tmp_filename, "wb") as file:
+    file.write(HEADER.pack(MAGIC, len(word_starts) - 1, word_starts[-1], len(names), len(text), len(deltas)))
+    for table in tables:
+      table.tofile(file)
+    file.write(names)
+    file.write(text)
+    file.write(deltas)
+  os.replace(tmp_filename, filename)
+
+def _encode_deltas(starts, out):
+  last = 0
+  for start in starts:
+    delta = max(start - last, 0)
+    last += delta
+    while delta >= 0x80:
+      out.append(delta & 0x7f | 0x80)
+      delta >>= 7
+    out.append(delta)
+
+def _decode_deltas(data, count):
+  starts = array("i")
+  last = 0
+  delta = shift = 0
+  for byte in data:
+    delta |= (byte & 0x7f) << shift
+    if byte & 0x80:
+      shift += 7
+      continue
+    last += delta
+    starts.append(last)
+    delta = shift = 0
+  assert len(starts) == count, "corrupt word timings"
+  return starts
+
+"""
+The path of the word file for a course json or course file, whether or not
+it exists
+"""
+def words_path(filename):
+  return os.path.splitext(filename)[0] + WORDS_SUFFIX
+
+
+class WordFile(object):
+
+  def __init__(self, filename):
+    with open(filename, "rb") as file:
+      self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    self.view = memoryview(self.map)
+    magic, videos, words, names_size, text_size, deltas_size = HEADER.unpack_from(self.map)
+    if magic != MAGIC:
+      raise ValueError("not a word file: " + filename)
+    self.num_videos = videos
+    self.num_words = words
+    self._offset = HEADER.size
+    self.word_starts = self._ints(videos + 1)
+    self.name_offsets = self._ints(2 * videos + 1)
+    self.text_offsets = self._ints(videos + 1)
+    self.delta_offsets = self._ints(videos + 1)
+    self.names = self._bytes(names_size)
+    self.text = self._bytes(text_size)
+    self.deltas = self._bytes(deltas_size)
+
+  def _ints(self, count):
+    table = self.view[self._offset:self._offset + 4 * count].cast("i")
+    self._offset += 4 * count
+    if sys.byteorder != "little":
+      table = array("i", table)
+      table.byteswap()
+    return table
+
+  def _bytes(self, size):
+    blob = self.view[self._offset:self._offset + size]
+    self._offset += size
+    return blob
+
+  def youtube_id(self, video_idx):
+    offsets = self.name_offsets
+    return str(self.names[offsets[2 * video_idx + 1]:offsets[2 * video_idx + 2]], "utf-8")
+
+  def streams(self):
+    """
+    The WordStream of every video, by YouTube id
+    """
+    return {self.youtube_id(video_idx): WordStream(self, video_idx) for video_idx in range(self.num_videos)}
+
+
+"""
+The words of one video, decoded from its word file on first use
+"""
+class WordStream(object):
+
+  def __init__(self, word_file, video_idx):
+    self.word_file = word_file
+    self.video_idx = video_idx
+    self._starts = None
+    self._lowered = None
+
+  def _decode(self):
+    word_file, video_idx = self.word_file, self.video_idx
+    count = word_file.word_starts[video_idx + 1] - word_file.word_starts[video_idx]
+    text = str(word_file.text[word_file.text_offsets[video_idx]:word_file.text_offsets[video_idx + 1]], "utf-8")
+    self._lowered = text.lower().split(" ") if count else []
+    self._starts = _decode_deltas(word_file.deltas[word_file.delta_offsets[video_idx]:word_file.delta_offsets[video_idx + 1]], count)
+
+  @property
+  def starts(self):
+    """
+    The millisecond each word starts at
+    """
+    if self._starts is None:
+      self._decode()
+    return self._starts
+
+  @property
+  def lowered(self):
+    if self._lowered is None:
+      self._decode()
+    return self._lowered
+
+  def seek(self, seconds, line, char_idx):
+    """
+    The millisecond at which the word holding line[char_idx] is spoken,
+    where line is a subtitle line starting at the given second. The line's
+    words are looked up within SEEK_WINDOW seconds of it, nearest first.
+    Returns None when they are not found.
+    """
+    tokens = line.lower().split()
+    if not tokens:
+      return None
+    word_no = min(len(line[:char_idx + 1].split()) - 1, len(tokens) - 1)
+    starts, lowered = self.starts, self.lowered
+    lo = bisect_left(starts, (seconds - SEEK_WINDOW) * 1000)
+    hi = bisect_right(starts, (seconds + SEEK_WINDOW) * 1000)
+    best = None
+    for i in range(lo, hi - len(tokens) + 1):
+      if lowered[i] == tokens[0] and lowered[i:i + len(tokens)] == tokens:
+        if best is None or abs(starts[i] - seconds * 1000) < abs(starts[best] - seconds * 1000):
+          best = i
+    if best is None:
+      return None
+    return starts[best + max(word_no, 0)]
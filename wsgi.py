@@ -0,0 +1,15 @@
+import logging
+import time
+
+from main import app, warm_up
+
+"""
+The application gunicorn serves (see gunicorn.conf.py).
+
+The worker imports this module before it takes requests, so every course
+index is built here and the first searches do not pay for building them.
+"""
+
+start = time.perf_counter()
+warm_up()
+logging.getLogger("gunicorn.error").info("course indexes built in %.2fs", time.perf_counter() - start)